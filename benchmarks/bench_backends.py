@@ -0,0 +1,163 @@
+"""
+Speed, memory and output agreement of the ASR and MT inference backends against the fp32 PyTorch models.
+
+Every backend runs in its own process, so the reported resident memory is that of one worker holding
+one model. ASR transcribes the sample audio, MT translates the sentences of the fp32 transcripts.
+Agreement is 1 - word error rate to the fp32 transcript for ASR, and the share of identical
+translations and the mean character similarity to the fp32 translation for MT.
+
+Usage:
+    python -m benchmarks.bench_backends --audio data/audio*.wav --models-dir ../data/cache/models --output backends.json
+"""
+import argparse
+import difflib
+import glob
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+
+from src.helpers import split_sentences
+
+ASR_BACKENDS = ("torch", "int8")
+MT_BACKENDS = ("torch", "int8", "onnx")
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/status", "r") as f: # Linux only
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+def _run_asr(backend: str, model_type: str, paths: List[str], repeat: int, models_dir: str, threads: int) -> Dict:
+    import torch
+    from src.asr import ASR, SAMPLE_RATE
+    from src.audio import AudioStore
+    from src.profiling import peak_rss_mb
+    torch.set_num_threads(threads)
+    wavs = [AudioStore(path).mono(SAMPLE_RATE) for path in paths]
+    base_rss = _rss_mb()
+    start = time.perf_counter()
+    asr = ASR(model_type=model_type, device="cpu", backend=backend, models_dir=models_dir).load()
+    load_s = time.perf_counter() - start
+    times, texts = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        texts = [" ".join(seg["text"].strip() for seg in asr._transcribe_wav(wav)) for wav in wavs]
+        times.append(time.perf_counter() - start)
+    return {
+        "load_s": load_s,
+        "median_s": float(np.median(times)),
+        "audio_s": sum(len(wav) for wav in wavs) / SAMPLE_RATE,
+        "model_rss_mb": _rss_mb() - base_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "outputs": texts,
+    }
+
+def _run_mt(backend: str, model_name: str, sentences: List[str], repeat: int, models_dir: str, threads: int) -> Dict:
+    import torch
+    from src.mt import MT
+    from src.profiling import peak_rss_mb
+    torch.set_num_threads(threads)
+    base_rss = _rss_mb()
+    start = time.perf_counter()
+    mt = MT(model_name=model_name, backend=backend, models_dir=models_dir).load()
+    load_s = time.perf_counter() - start
+    times, translations = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        translations = mt._generate(sentences)
+        times.append(time.perf_counter() - start)
+    return {
+        "load_s": load_s,
+        "median_s": float(np.median(times)),
+        "sentences": len(sentences),
+        "model_rss_mb": _rss_mb() - base_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "outputs": translations,
+    }
+
+def _in_process(fn, *args) -> Dict:
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+        return pool.submit(fn, *args).result()
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    ref, hyp = reference.lower().split(), hypothesis.lower().split()
+    if not ref:
+        return float(bool(hyp))
+    distance = np.arange(len(hyp) + 1)
+    for i, word in enumerate(ref, 1):
+        previous, distance = distance, np.empty_like(distance)
+        distance[0] = i
+        for j, other in enumerate(hyp, 1):
+            distance[j] = min(previous[j] + 1, distance[j - 1] + 1, previous[j - 1] + (word != other))
+    return distance[-1] / len(ref)
+
+def agreement(kind: str, reference: List[str], outputs: List[str]) -> Dict:
+    if kind == "asr":
+        wer = float(np.mean([word_error_rate(r, o) for r, o in zip(reference, outputs)]))
+        return {"wer_vs_fp32": round(wer, 4), "agreement": round(1 - wer, 4)}
+    similarity = [difflib.SequenceMatcher(None, r, o).ratio() for r, o in zip(reference, outputs)]
+    return {
+        "exact_match": round(float(np.mean([r == o for r, o in zip(reference, outputs)])), 4),
+        "char_similarity": round(float(np.mean(similarity)), 4),
+    }
+
+def compare(kind: str, results: Dict[str, Dict]) -> None:
+    reference = results["torch"]
+    for backend, result in results.items():
+        if "error" in result:
+            print(f"{kind} {backend:6s} failed: {result['error']}")
+            continue
+        result["speedup"] = round(reference["median_s"] / result["median_s"], 2)
+        result["memory_ratio"] = round(result["model_rss_mb"] / reference["model_rss_mb"], 2)
+        result.update(agreement(kind, reference["outputs"], result["outputs"]))
+        agree = result.get("agreement", result.get("char_similarity"))
+        print(
+            f"{kind} {backend:6s} load {result['load_s']:6.2f} s  run {result['median_s']:7.2f} s  "
+            f"x{result['speedup']:.2f}  model {result['model_rss_mb']:7.0f} MB  agreement {agree:.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--audio", nargs="+", default=sorted(glob.glob("data/audio*.wav")))
+    parser.add_argument("--asr-model", default="base")
+    parser.add_argument("--mt-model", default="Helsinki-NLP/opus-mt-en-ru")
+    parser.add_argument("--asr-backends", nargs="*", default=list(ASR_BACKENDS))
+    parser.add_argument("--mt-backends", nargs="*", default=list(MT_BACKENDS))
+    parser.add_argument("--models-dir", default=None, help="cache of converted models, converted on every run if None")
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    report = {"audio": args.audio, "threads": args.threads, "asr": {}, "mt": {}}
+    for backend in ["torch"] + [b for b in args.asr_backends if b != "torch"]:
+        report["asr"][backend] = _in_process(
+            _run_asr, backend, args.asr_model, args.audio, args.repeat, args.models_dir, args.threads
+        )
+    compare("asr", report["asr"])
+
+    sentences = [s for text in report["asr"]["torch"]["outputs"] for s in split_sentences(text)]
+    for backend in ["torch"] + [b for b in args.mt_backends if b != "torch"]:
+        try:
+            report["mt"][backend] = _in_process(
+                _run_mt, backend, args.mt_model, sentences, args.repeat, args.models_dir, args.threads
+            )
+        except ImportError as e: # the onnx backend is optional
+            report["mt"][backend] = {"error": str(e)}
+    compare("mt", report["mt"])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
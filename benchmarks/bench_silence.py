@@ -0,0 +1,55 @@
+"""
+Throughput of src.silence against pydub.silence.detect_nonsilent, on data/*.wav
+tiled to the requested durations. Parity is checked by tests/test_silence.py.
+
+Usage:
+    python -m benchmarks.bench_silence --durations 60 600
+"""
+import argparse
+import glob
+import json
+import time
+
+import numpy as np
+from pydub import AudioSegment
+from pydub.silence import detect_nonsilent as pydub_detect_nonsilent
+
+from src.audio import AudioStore
+from src.silence import detect_nonsilent
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", default="data/*.wav")
+    parser.add_argument("--durations", type=float, nargs="+", default=[60, 600])
+    parser.add_argument("--skip-pydub-above", type=float, default=600, help="pydub is too slow on longer inputs")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(args.data))
+
+    store = AudioStore(paths[0])
+    results = []
+    for duration in args.durations:
+        repeats = int(np.ceil(duration * 1000 / store.len_ms))
+        samples = np.tile(store.samples, (repeats, 1))
+        start = time.perf_counter()
+        detect_nonsilent(samples, store.sample_rate, 700, -40, sample_width=store.sample_width)
+        vectorized = time.perf_counter() - start
+        result = {"duration": duration, "vectorized_s": round(vectorized, 3)}
+        if duration <= args.skip_pydub_above:
+            segment = AudioSegment.from_file(paths[0]) * repeats
+            start = time.perf_counter()
+            pydub_detect_nonsilent(segment, 700, -40)
+            result["pydub_s"] = round(time.perf_counter() - start, 3)
+            result["speedup"] = round(result["pydub_s"] / vectorized, 1)
+        results.append(result)
+        print(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
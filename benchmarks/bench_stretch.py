@@ -0,0 +1,58 @@
+"""
+Speed and output length accuracy of the time-stretch methods ("sox" and "wsola").
+
+Usage:
+    python -m benchmarks.bench_stretch --durations 1 5 15 --rates 0.7 1.0 1.3 1.8
+"""
+import argparse
+import json
+import time
+
+from benchmarks.synthetic import speech_like
+from src.helpers import stretch
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--durations", type=float, nargs="+", default=[1, 5, 15])
+    parser.add_argument("--rates", type=float, nargs="+", default=[0.7, 1.0, 1.3, 1.8])
+    parser.add_argument("--methods", nargs="+", default=["sox", "wsola"])
+    parser.add_argument("--sample-rate", type=int, default=24000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    results = []
+    for duration in args.durations:
+        audio = speech_like(duration, args.sample_rate)
+        for rate in args.rates:
+            target = duration / rate
+            for method in args.methods:
+                try:
+                    start = time.perf_counter()
+                    for _ in range(args.repeat):
+                        out = stretch(audio, args.sample_rate, target, method=method)
+                    elapsed = (time.perf_counter() - start) / args.repeat
+                except (AttributeError, RuntimeError) as e: # sox backend missing in this torchaudio build
+                    print(f"{method}: unavailable ({e})")
+                    continue
+                length_error = abs(len(out) / args.sample_rate - target) * 1000
+                results.append({
+                    "method": method,
+                    "duration": duration,
+                    "rate": rate,
+                    "ms": round(elapsed * 1000, 2),
+                    "length_error_ms": round(length_error, 2),
+                })
+                print(
+                    f"{method:6s} duration={duration:5.1f}s rate={rate:.2f}: "
+                    f"{elapsed * 1000:8.2f} ms, length error {length_error:.2f} ms"
+                )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
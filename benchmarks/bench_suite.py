@@ -0,0 +1,239 @@
+"""
+Offline benchmark suite: model-free stages on synthetic audio of several lengths and the full
+VideoDubPipe.transform orchestration with stub models. No checkpoints or recordings are needed.
+
+Results are written as JSON with the median time of every stage and length, the scaling exponent
+of every stage over the lengths (1 is linear, 2 is quadratic) and, with --baseline, the ratio to an
+earlier result file.
+
+Usage:
+    python -m benchmarks.bench_suite --lengths 30 120 480 --output bench.json
+    python -m benchmarks.bench_suite --output new.json --baseline bench.json --fail-on-regression
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+import yaml
+
+from benchmarks.stubs import StubASR, StubMT, StubTTS, StubVAD
+from benchmarks.synthetic import speech_with_pauses, write_wav
+from src.audio import AudioStore
+from src.helpers import concat_chunks, np_to_audiosegment, overlay_on_chunk, stretch
+from src.pipeline import VideoDubPipe
+from src.profiling import Profiler
+from src.segments import SegmentTable
+from src.utils import get_chunks, update_boundary
+from src.vad import merge_timestamps
+
+SAMPLE_RATE = 24000
+
+
+def stage_cases(length: float, work_dir: str) -> Dict[str, Callable]:
+    """
+    Builds the inputs of every model-free stage for `length` seconds of audio.
+
+    Returns:
+        Dict[str, Callable]: stage name to a call that runs the stage once.
+    """
+    audio, phrases = speech_with_pauses(length, SAMPLE_RATE)
+    path = write_wav(os.path.join(work_dir, f"input_{length:g}.wav"), audio, SAMPLE_RATE)
+    segments = [[int(start * 1000), int(end * 1000)] for start, end in phrases]
+
+    timestamps = [] # three VAD pieces per phrase, 16 kHz samples
+    for start, end in phrases:
+        bounds = np.linspace(start, end, 4) * 16000
+        timestamps.extend({"start": int(a) + 800, "end": int(b)} for a, b in zip(bounds[:-1], bounds[1:]))
+
+    chunks = {
+        i: {
+            "len": round((end - start) / 1000, 1),
+            "orig_seg": {"start": start, "end": end},
+            "speech_boundary": [{"start": 1600, "end": (end - start) * 16 - 1600}],
+        }
+        for i, (start, end) in enumerate(segments)
+    }
+    lengths = np.array([chunk["len"] for chunk in chunks.values()])
+    durations = list(np.random.default_rng(0).uniform(0.5, 1.5, len(chunks)) * lengths)
+    table = SegmentTable.from_chunks(chunks)
+
+    segment = np_to_audiosegment(audio, SAMPLE_RATE)
+    synth_segment = np_to_audiosegment(audio[:len(audio) // 2], SAMPLE_RATE)
+    chunk_segments = [segment[start:end] for start, end in segments]
+
+    return {
+        "get_chunks": lambda: get_chunks(AudioStore(path), work_dir, save=False, run_vad=False),
+        "merge_timestamps": lambda: merge_timestamps(timestamps, threshold=16000),
+        "update_boundary": lambda: update_boundary(chunks, durations),
+        "fit_boundaries": lambda: table.fit_boundaries(durations),
+        "stretch": lambda: stretch(audio, SAMPLE_RATE, length / 1.2, method="wsola"),
+        "np_to_audiosegment": lambda: np_to_audiosegment(audio, SAMPLE_RATE),
+        "overlay_on_chunk": lambda: overlay_on_chunk(segment, 1000, len(segment) - 1000, synth_segment),
+        "concat_chunks": lambda: concat_chunks(chunk_segments, segments, len(segment)),
+    }
+
+def time_call(fn: Callable, repeat: int) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+def bench_stages(lengths: List[float], repeat: int, stages: List[str], work_dir: str) -> List[Dict]:
+    results = []
+    for length in lengths:
+        cases = stage_cases(length, work_dir)
+        for name in stages or cases:
+            times = time_call(cases[name], repeat)
+            results.append({
+                "name": name,
+                "length_s": length,
+                "median_s": float(np.median(times)),
+                "min_s": min(times),
+                "repeat": repeat,
+            })
+            print(f"{name:20s} {length:7.0f} s audio: {np.median(times) * 1000:10.2f} ms")
+    return results
+
+def scaling(results: List[Dict]) -> Dict[str, float]:
+    """
+    Slope of log(time) over log(length) for every stage: 1 for linear, 2 for quadratic growth.
+    """
+    by_name = {}
+    for r in results:
+        by_name.setdefault(r["name"], []).append((r["length_s"], r["median_s"]))
+    exponents = {}
+    for name, points in by_name.items():
+        if len(points) > 1:
+            lengths, times = np.log(np.array(points)).T
+            exponents[name] = round(float(np.polyfit(lengths, times, 1)[0]), 2)
+    return exponents
+
+def pipeline_config(work_dir: str, reference_wav: str, streaming: bool) -> str:
+    cfg = {
+        "device": "cpu",
+        "tts_checkpoint": None,
+        "reference_wav": reference_wav,
+        "sample_rate": SAMPLE_RATE,
+        "chunks": {},
+        "asr": {"model_type": "base"},
+        "tts": {"cutoff": None},
+        "mt": {"model_name": "stub"},
+        "postprocess": {"stretch_method": "wsola"},
+        "cache": {"dir": None, "resume": False},
+        "pipeline": {"streaming": streaming},
+    }
+    path = os.path.join(work_dir, f"config_{'streaming' if streaming else 'stages'}.yaml")
+    with open(path, "w") as f:
+        yaml.safe_dump(cfg, f)
+    return path
+
+def bench_transform(lengths: List[float], repeat: int, work_dir: str) -> List[Dict]:
+    results = []
+    for length in lengths:
+        audio, _ = speech_with_pauses(length, SAMPLE_RATE, seed=1)
+        path = write_wav(os.path.join(work_dir, f"transform_{length:g}.wav"), audio, SAMPLE_RATE)
+        for streaming in (False, True):
+            pipeline = VideoDubPipe(
+                pipeline_config(work_dir, path, streaming),
+                asr_model=StubASR(), mt_model=StubMT(), tts_model=StubTTS(), vad=StubVAD(),
+            )
+            output_dir = os.path.join(work_dir, "out")
+            times = []
+            for _ in range(repeat): # the median leaves out one-off costs such as lazy imports
+                profiler = Profiler()
+                start = time.perf_counter()
+                with profiler.activate():
+                    pipeline.transform(path, output_dir, os.path.join(output_dir, "dubbed.wav"))
+                times.append(time.perf_counter() - start)
+            elapsed = float(np.median(times))
+            name = "transform_streaming" if streaming else "transform"
+            results.append({
+                "name": name,
+                "length_s": length,
+                "median_s": elapsed,
+                "min_s": min(times),
+                "repeat": repeat,
+                "rtf": elapsed / length,
+                "spans": {span: round(total["wall_s"], 4) for span, total in profiler.summary().items()},
+            })
+            print(f"{name:20s} {length:7.0f} s audio: {elapsed * 1000:10.2f} ms, RTF {elapsed / length:.4f}")
+    return results
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[Dict]:
+    base = {(r["name"], r["length_s"]): r["median_s"] for r in baseline}
+    comparison = []
+    for r in results:
+        key = (r["name"], r["length_s"])
+        if key not in base:
+            continue
+        ratio = r["median_s"] / base[key]
+        comparison.append({
+            "name": r["name"],
+            "length_s": r["length_s"],
+            "baseline_s": base[key],
+            "current_s": r["median_s"],
+            "ratio": round(ratio, 3),
+            "regression": ratio > 1 + tolerance,
+        })
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lengths", type=float, nargs="+", default=[30, 120, 480])
+    parser.add_argument("--transform-lengths", type=float, nargs="*", default=[30, 120])
+    parser.add_argument("--stages", nargs="*", default=None, help="model-free stages to run, all by default")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--baseline", default=None, help="earlier result file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="slowdown ratio over 1 reported as regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        stage_results = bench_stages(args.lengths, args.repeat, args.stages, work_dir)
+        transform_results = bench_transform(args.transform_lengths, args.repeat, work_dir)
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "stages": stage_results,
+        "scaling": scaling(stage_results),
+        "transform": transform_results,
+    }
+    print("Scaling exponents: " + ", ".join(f"{k} {v}" for k, v in report["scaling"].items()))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        report["comparison"] = compare(
+            stage_results + transform_results, baseline["stages"] + baseline["transform"], args.tolerance
+        )
+        for c in report["comparison"]:
+            flag = "  REGRESSION" if c["regression"] else ""
+            print(f"{c['name']:20s} {c['length_s']:7.0f} s audio: x{c['ratio']:.2f}{flag}")
+        regressions = [c for c in report["comparison"] if c["regression"]]
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Speedup of XTTSv2.tts_chunks against the number of worker processes.
+
+Usage:
+    python -m benchmarks.bench_tts_pool --config config/config.yaml --workers 1 2 4 8
+"""
+import argparse
+import json
+import os
+import time
+
+from config import config
+
+from src.tts import XTTSv2
+
+LINES = [
+    "Привет! Сегодня мы поговорим о том, как избавиться от вредной привычки.",
+    "Это довольно простой способ, и он работает лучше, чем вы думаете.",
+    "Когда мы замечаем желание, мы можем просто понаблюдать за ним.",
+    "Любопытство помогает нам увидеть, что на самом деле происходит.",
+]
+
+
+def run(cfg, workers: int, threads: int, n_lines: int) -> float:
+    model = XTTSv2(device=cfg["device"], workers=workers, worker_threads=threads)
+    chunks = {i: {"translated_text": LINES[i % len(LINES)]} for i in range(n_lines)}
+    tts_config = cfg["tts"].model_dump(exclude={"workers", "torch_threads"})
+    warmup = {i: chunks[i] for i in range(min(workers, n_lines))}
+    model.tts_chunks(warmup, cfg["reference_wav"], **tts_config) # model loading is not measured
+    start = time.perf_counter()
+    model.tts_chunks(chunks, cfg["reference_wav"], **tts_config)
+    elapsed = time.perf_counter() - start
+    model.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--threads", type=int, default=None, help="torch threads per worker")
+    parser.add_argument("--lines", type=int, default=32)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    cfg = config.load_config(args.config)
+    results = []
+    for workers in args.workers:
+        threads = args.threads or max(1, (os.cpu_count() or 1) // workers)
+        elapsed = run(cfg, workers, threads, args.lines)
+        results.append({"workers": workers, "threads": threads, "seconds": round(elapsed, 2)})
+        print(f"workers={workers} threads={threads}: {elapsed:.2f}s")
+
+    base = results[0]["seconds"]
+    for r in results:
+        r["speedup"] = round(base / r["seconds"], 2)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Lightweight stand-ins for ASR, MT, XTTSv2 and VAD with the same interfaces, for benchmarking the pipeline
+orchestration without checkpoints. Outputs are deterministic and scale with the input like the real models'.
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from src.audio import AudioStore, empty_audio
+from src.helpers import split_sentences
+from src.tts import plan_budget, speech_slot
+from src.vad import VAD
+
+WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel"]
+
+
+class StubASR:
+    """
+    Emits one segment per speech piece, 2.5 words per second, a sentence every 8 words.
+    """
+
+    def __init__(self, words_per_s: float = 2.5, batch_size: int = 1):
+        self.words_per_s = words_per_s
+        self.batch_size = batch_size
+
+    def load(self) -> "StubASR":
+        return self
+
+    def _text(self, duration: float) -> str:
+        words = [WORDS[i % len(WORDS)] for i in range(max(1, int(duration * self.words_per_s)))]
+        sentences = [" ".join(words[i:i + 8]).capitalize() + "." for i in range(0, len(words), 8)]
+        return " " + " ".join(sentences)
+
+    def transcribe(
+        self, chunks_json: Dict, store: Optional[AudioStore] = None, output_dir: str = None, save: bool = True
+    ) -> Optional[Dict]:
+        for chunk in chunks_json.values():
+            chunk["asr_result"] = []
+            for seg in chunk["speech_boundary"]:
+                duration = (seg["end"] - seg["start"]) / 16000
+                chunk["asr_result"].append([{"start": 0.0, "end": duration, "text": self._text(duration)}])
+        return chunks_json
+
+
+class StubMT:
+    """
+    "Translates" by reversing every sentence, joined per chunk like MT.translate.
+    """
+
+    def __init__(self, batch_size: int = 16):
+        self.batch_size = batch_size
+
+    def load(self) -> "StubMT":
+        return self
+
+    def cache_stats(self) -> Optional[Dict]:
+        return None
+
+    def translate(self, text: Union[str, Dict]) -> Union[str, Dict]:
+        if isinstance(text, str):
+            return text[::-1]
+        translated = defaultdict(list)
+        for key, chunk in text.items():
+            chunk_text = " ".join([s["text"].strip() for seg in chunk["asr_result"] for s in seg])
+            translated[key] = [sentence[::-1] for sentence in split_sentences(chunk_text)]
+        for key, chunk in text.items():
+            chunk["translated_text"] = " ".join(translated[key])
+        return text
+
+
+class StubTTS:
+    """
+    Synthesizes a tone of 15 characters per second (scaled by `speed`) at 24 kHz.
+    With `budget` the speed is planned per chunk like XTTSv2.
+    """
+
+    model_id = "stub"
+    audio_cache = None
+
+    def __init__(self, chars_per_s: float = 15, sample_rate: int = 24000):
+        self.chars_per_s = chars_per_s
+        self.sample_rate = sample_rate
+        self.sample_counts = {"generated": 0, "cut": 0}
+
+    def load(self) -> "StubTTS":
+        return self
+
+    def close(self) -> None:
+        pass
+
+    def speaker_hash(self, speaker_wav: Union[str, List]) -> str:
+        return "stub"
+
+    def tts_chunks(
+        self, chunks: Dict, speaker_wav: Union[str, List], speed: float = 1, budget: bool = False,
+        max_speed: float = 1.6, chars_per_s: float = 14.0, min_chars_per_s: float = 8.0, token_margin: float = 1.3,
+        **params
+    ) -> List:
+        result_chunks = []
+        for chunk in chunks.values():
+            text = chunk["translated_text"]
+            if not text:
+                result_chunks.append(empty_audio())
+                continue
+            chunk_speed = speed
+            if budget and speech_slot(chunk) > 0:
+                chunk_speed = plan_budget(
+                    text, speech_slot(chunk), speed, max_speed, chars_per_s, min_chars_per_s, token_margin
+                )["speed"]
+            n = int(len(text) / self.chars_per_s / chunk_speed * self.sample_rate)
+            t = np.arange(n, dtype=np.float32) / self.sample_rate
+            result_chunks.append((0.3 * np.sin(2 * np.pi * 180 * t)).astype(np.float32))
+        self.sample_counts["generated"] += sum(len(audio) for audio in result_chunks)
+        return result_chunks
+
+    def speaker_embedding(self, speaker_wav: Union[str, List]) -> np.ndarray:
+        path = speaker_wav if isinstance(speaker_wav, str) else speaker_wav[0]
+        return self.speaker_embeddings([AudioStore(path).mono(self.sample_rate)])[0]
+
+    def speaker_embeddings(self, audios: List[np.ndarray], sample_rate: int = 24000, **kwargs) -> np.ndarray:
+        """
+        Mean log magnitude spectrum of 512-sample frames, L2-normalized. NaN for clips shorter than a frame.
+        """
+        frame = 512
+        embeddings = np.full((len(audios), frame // 2 + 1), np.nan, dtype=np.float32)
+        for i, audio in enumerate(audios):
+            n = len(audio) // frame
+            if n:
+                spectrum = np.log1p(np.abs(np.fft.rfft(audio[:n * frame].reshape(n, frame), axis=1))).mean(axis=0)
+                embeddings[i] = spectrum / np.linalg.norm(spectrum)
+        return embeddings
+
+
+class StubVAD(VAD):
+    """
+    Energy VAD: 32 ms frames above `threshold_db` dBFS are speech. Mapped onto chunks like VAD.
+    """
+
+    def __init__(self, threshold: float = 16000, threshold_db: float = -35, **kwargs):
+        super().__init__(threshold=threshold, **kwargs)
+        self.threshold_db = threshold_db
+
+    def load(self) -> "StubVAD":
+        return self
+
+    def speech(self, wav: np.ndarray) -> np.ndarray:
+        frame = 512
+        n = len(wav) // frame
+        rms = np.sqrt(np.mean(np.square(wav[:n * frame].reshape(n, frame)), axis=1))
+        active = np.concatenate([[False], rms > 10 ** (self.threshold_db / 20), [False]])
+        edges = np.flatnonzero(np.diff(active.astype(np.int8)))
+        return (edges.reshape(-1, 2) * frame).astype(np.int64)
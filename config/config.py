@@ -8,9 +8,16 @@ class BaseModelClass(BaseModel):
     def __getitem__(self, key):
         return getattr(self, key)
     
+class ChunkConfig(BaseModelClass):
+    min_silence_len: int = 700
+    silence_thresh: int = -40
+    export_wavs: bool = False
+
 class ASRConfig(BaseModelClass):
     model_type: Literal["small", "base", "large"]
     save_results: bool = False
+    batch_size: int = 1
+    backend: Literal["torch", "int8"] = "torch"
 
 class TTSConfig(BaseModelClass):
     language: str = "ru"
@@ -19,15 +26,48 @@ class TTSConfig(BaseModelClass):
     repetition_penalty: float = 10.0
     temperature: float = 0.3
     cutoff: Optional[float]
+    budget: bool = False
+    max_speed: float = 1.6
+    chars_per_s: float = 14.0
+    min_chars_per_s: float = 8.0
+    token_margin: float = 1.3
+    workers: int = 1
+    torch_threads: int = 1
 
 class MTConfig(BaseModelClass):
     model_name: str
+    batch_size: int = 16
+    backend: Literal["torch", "int8", "onnx"] = "torch"
+
+class CacheConfig(BaseModelClass):
+    dir: Optional[str] = None
+    mt_max_entries: int = 100_000
+    tts_max_mb: int = 2048
+    resume: bool = True
+    checkpoint_every: int = 8
 
 class PostProcess(BaseModelClass):
     fade_out: float = 100
     pause: float = 0.005
     orig_gain: int = -6
     synth_gain: int = 6
+    stretch_method: Literal["sox", "wsola"] = "sox"
+
+class PipelineConfig(BaseModelClass):
+    streaming: bool = False
+    queue_size: int = 2
+    mmap_dir: Optional[str] = None
+    warmup: bool = False
+    profile_dir: Optional[str] = None
+
+class BatchConfig(BaseModelClass):
+    files_in_flight: int = 4
+    group_size: int = 32
+
+class EvaluationConfig(BaseModelClass):
+    batch_size: int = 16
+    max_s: float = 10.0
+    min_similarity: Optional[float] = None
 
 class Config(BaseModelClass):
     device: Literal["cpu", "cuda"]
@@ -35,10 +75,15 @@ class Config(BaseModelClass):
     reference_wav: str
     sample_rate: int = 24000
 
+    chunks: ChunkConfig = ChunkConfig()
     asr: ASRConfig
     tts: TTSConfig
     mt: MTConfig
     postprocess: PostProcess
+    cache: CacheConfig = CacheConfig()
+    pipeline: PipelineConfig = PipelineConfig()
+    batch: BatchConfig = BatchConfig()
+    evaluation: EvaluationConfig = EvaluationConfig()
 
 
 def load_config(path: str = "config.yaml") -> Config:
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+
+from src.helpers import to_serializable
+
+DONE_MARKER = "_done"
+
+
+def stage_key(*parts: Any) -> str:
+    """
+    Deterministic key of a stage from its upstream key and configuration.
+    """
+    payload = json.dumps(parts, sort_keys=True, default=to_serializable)
+    return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+
+class ArtifactStore:
+    """
+    On-disk results of pipeline stages under deterministic paths.
+
+    Every stage writes to `root/<stage>/<key>/`, where the key hashes the stage inputs and config,
+    so unchanged stages are found again on the next run. Per-chunk results are written one file
+    per chunk (JSON, or `.npy` for arrays), so an interrupted stage resumes at chunk level.
+
+    Args:
+        root (str): Root directory of the store.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def stage_dir(self, stage: str, key: str) -> str:
+        return os.path.join(self.root, stage, key)
+
+    def is_done(self, stage: str, key: str) -> bool:
+        return os.path.exists(os.path.join(self.stage_dir(stage, key), DONE_MARKER))
+
+    def mark_done(self, stage: str, key: str) -> None:
+        os.makedirs(self.stage_dir(stage, key), exist_ok=True)
+        open(os.path.join(self.stage_dir(stage, key), DONE_MARKER), "w").close()
+
+    def save(self, stage: str, key: str, name: str, data: Any) -> str:
+        stage_dir = self.stage_dir(stage, key)
+        os.makedirs(stage_dir, exist_ok=True)
+        if isinstance(data, np.ndarray):
+            path = os.path.join(stage_dir, f"{name}.npy")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, data)
+        else:
+            path = os.path.join(stage_dir, f"{name}.json")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, default=to_serializable)
+        os.replace(tmp_path, path)
+        return path
+
+    def load(self, stage: str, key: str, name: str) -> Optional[Any]:
+        base = os.path.join(self.stage_dir(stage, key), name)
+        if os.path.exists(f"{base}.npy"):
+            return np.load(f"{base}.npy")
+        if os.path.exists(f"{base}.json"):
+            with open(f"{base}.json", "r") as f:
+                return json.load(f)
+        return None
+
+    def save_chunk(self, stage: str, key: str, chunk_id: Hashable, data: Any) -> str:
+        return self.save(stage, key, f"chunk_{chunk_id}", data)
+
+    def load_chunks(self, stage: str, key: str) -> Dict[int, Any]:
+        """
+        Returns all per-chunk results already written for the stage, keyed by chunk id.
+        """
+        stage_dir = self.stage_dir(stage, key)
+        if not os.path.isdir(stage_dir):
+            return {}
+        results = {}
+        for name in os.listdir(stage_dir):
+            stem, ext = os.path.splitext(name)
+            if stem.startswith("chunk_") and ext in (".json", ".npy"):
+                results[int(stem[len("chunk_"):])] = self.load(stage, key, stem)
+        return results
@@ -1,64 +1,229 @@
-
-from typing import Dict, List, Optional
+import threading
+from typing import Dict, List, Optional, Tuple, Union
 
 import numpy as np
-import whisper
 
+from src.audio import AudioStore
+from src.backends import converted_path, load_int8
 from src.helpers import write_json
+from src.profiling import span
+
+# whisper.audio constants, whisper itself is imported when the model is loaded
+SAMPLE_RATE = 16000
+N_SAMPLES = 30 * SAMPLE_RATE
+PACK_GAP = SAMPLE_RATE  # 1 s of silence between packed segments
+
+
+def _split_by_piece(seg: Dict, bounds: np.ndarray) -> List[Tuple[int, float, float, str]]:
+    """
+    Splits a Whisper segment of a packed window by the pieces its words fall in: the piece containing
+    the middle of the word, or the nearest one for words in a gap. Segments without words go
+    to the piece with the largest overlap.
+
+    Returns:
+        List[Tuple[int, float, float, str]]: (piece index, start, end, text) for every piece with words, in window time.
+    """
+    words = seg.get("words") or []
+    if not words:
+        overlap = np.minimum(bounds[:, 1], seg["end"]) - np.maximum(bounds[:, 0], seg["start"])
+        return [(int(np.argmax(overlap)), seg["start"], seg["end"], seg["text"])]
+    middles = np.array([(word["start"] + word["end"]) / 2 for word in words])
+    distance = np.maximum(np.maximum(bounds[None, :, 0] - middles[:, None], middles[:, None] - bounds[None, :, 1]), 0)
+    pieces = np.argmin(distance, axis=1)
+    result = []
+    for word, idx in zip(words, pieces.tolist()):
+        if result and result[-1][0] == idx:
+            _, start, _, text = result[-1]
+            result[-1] = (idx, start, word["end"], text + word["word"])
+        else:
+            result.append((idx, word["start"], word["end"], word["word"]))
+    return result
 
 
 class ASR:
     """
     A class for Automatic Speech Recognition (ASR) using the Whisper model.
+    The model is loaded on first use, or with `load()`.
 
     Args:
         model_type (str): The type of Whisper model to use. Default is "base".
         device (str): The device to run the model on. Default is the CUDA device if available, otherwise the CPU.
+        batch_size (int): Max number of speech segments packed into one 30 s Whisper window. 1 disables packing.
+        backend (str): "torch" (fp32) or "int8" (dynamic int8 quantization of the linear layers, CPU only).
+        models_dir (Optional[str]): Cache of the quantized model. Quantized on every load if None.
     """
 
-    def __init__(self, model_type: str = "base", device: str = "cpu"):
+    def __init__(
+        self,
+        model_type: str = "base",
+        device: str = "cpu",
+        batch_size: int = 1,
+        backend: str = "torch",
+        models_dir: Optional[str] = None,
+    ):
         """
         Initializes the ASR class with a Whisper model.
 
         Args:
             model_type (str): The type of Whisper model to use. Default is "base".
             device (str): The device to run the model on. Default is the CUDA device if available, otherwise the CPU.
-            save (bool): Save to json
+            batch_size (int): Max number of speech segments packed into one 30 s Whisper window.
+            backend (str): "torch" or "int8".
+            models_dir (Optional[str]): Cache of the quantized model.
         """
-        self.model = whisper.load_model(model_type, device)
+        if backend not in ("torch", "int8"):
+            raise ValueError(f"Unknown ASR backend: {backend}")
+        if backend == "int8" and device != "cpu":
+            raise ValueError("The int8 ASR backend runs on CPU only")
+        self.model_type = model_type
+        self.device = device
+        self.batch_size = batch_size
+        self.backend = backend
+        self.models_dir = models_dir
+        self._model = None
+        self._load_lock = threading.Lock()
+
+    @property
+    def model(self):
+        with self._load_lock:
+            if self._model is None:
+                import whisper
+                if self.backend == "int8":
+                    import torch
+                    path = converted_path(
+                        self.models_dir, f"whisper-{self.model_type}", self.backend, torch.__version__, whisper.__version__
+                    )
+                    self._model = load_int8(lambda: whisper.load_model(self.model_type, "cpu"), path)
+                else:
+                    self._model = whisper.load_model(self.model_type, self.device)
+        return self._model
+
+    def load(self) -> "ASR":
+        self.model
+        return self
     
-    def _transcribe_wav(self, wav: np.ndarray) -> List[Dict]:
+    def _transcribe_wav(self, wav: np.ndarray, chunk=None, word_timestamps: bool = False) -> List[Dict]:
         """
         Transcribes an audio file.
 
         Args:
             wav_path (str): The path to the audio file to transcribe.
+            chunk: Id(s) of the chunk(s) the audio belongs to, for profiling.
+            word_timestamps (bool): Adds the timed `words` of every segment.
         Returns:
             List[Dict]: list of segments.
         """
-        results = self.model.transcribe(wav)
-        segments = results.get("segments", [])
+        with span("asr.whisper", chunk=chunk, audio_s=len(wav) / SAMPLE_RATE) as record:
+            results = self.model.transcribe(wav, fp16=self.device != "cpu", word_timestamps=word_timestamps)
+            segments = results.get("segments", [])
+            record["counts"]["segments"] = len(segments)
         if not segments:
             print("No segments")
             return []
         return segments
 
 
-    def transcribe(self, chunks_json: Dict, output_dir: str = None, save: bool = True) -> Optional[Dict]:
-        for chunk in chunks_json.values():
-            chunk_asr = []
+    def _pack(self, pieces: List[np.ndarray]) -> List[List[int]]:
+        """
+        Greedily groups consecutive segments into windows that fit one Whisper mel window.
+
+        Returns:
+            List[List[int]]: indices of `pieces` for every window.
+        """
+        windows, current, current_len = [], [], 0
+        for i, piece in enumerate(pieces):
+            piece_len = len(piece) + (PACK_GAP if current else 0)
+            if current and (current_len + piece_len > N_SAMPLES or len(current) >= self.batch_size):
+                windows.append(current)
+                current, current_len, piece_len = [], 0, len(piece)
+            current.append(i)
+            current_len += piece_len
+        if current:
+            windows.append(current)
+        return windows
+
+    def _transcribe_packed(self, pieces: List[np.ndarray], owners: List) -> List[List[Dict]]:
+        """
+        Transcribes short segments packed into shared 30 s windows (one encoder pass per window)
+        and maps every word of the Whisper segments back to the segment it was spoken in, so a Whisper
+        segment spanning the gap between two pieces (possibly of different chunks) is split between them.
+
+        Returns:
+            List[List[Dict]]: whisper segments for every piece, timestamps relative to the piece.
+        """
+        sr = SAMPLE_RATE
+        results = [[] for _ in pieces]
+        for window in self._pack(pieces):
+            if len(window) == 1:
+                results[window[0]] = self._transcribe_wav(pieces[window[0]], owners[window[0]])
+                continue
+
+            gap = np.zeros(PACK_GAP, dtype=np.float32)
+            parts, bounds, offset = [], [], 0
+            for i in window:
+                if parts:
+                    parts.append(gap)
+                    offset += PACK_GAP
+                parts.append(pieces[i])
+                bounds.append((offset / sr, (offset + len(pieces[i])) / sr))
+                offset += len(pieces[i])
+            bounds = np.array(bounds)
+
+            window_owners = sorted({owners[i] for i in window})
+            for seg in self._transcribe_wav(np.concatenate(parts), window_owners, word_timestamps=True):
+                for idx, start, end, text in _split_by_piece(seg, bounds):
+                    piece_start, piece_end = bounds[idx]
+                    results[window[idx]].append({
+                        "start": float(np.clip(start - piece_start, 0, piece_end - piece_start)),
+                        "end": float(np.clip(end - piece_start, 0, piece_end - piece_start)),
+                        "text": text,
+                    })
+        return results
+
+    def transcribe(
+        self,
+        chunks_json: Dict,
+        store: Optional[Union[AudioStore, Dict]] = None,
+        output_dir: str = None,
+        save: bool = True,
+    ) -> Optional[Dict]:
+        """
+        Transcribes the speech pieces of every chunk into `chunk["asr_result"]`.
+
+        Args:
+            chunks_json (Dict): Chunks with `speech_boundary`.
+            store (Optional[Union[AudioStore, Dict]]): Audio of the chunks, or a store per chunk key when
+                the chunks come from several files. Chunks are read from `chunk["path"]` if None.
+        """
+        pieces, owners = [], []
+        for key, chunk in chunks_json.items():
+            chunk_store = store.get(key) if isinstance(store, dict) else store
+            if chunk_store is not None:
+                chunk_audio = chunk_store.chunk(chunk, sample_rate=SAMPLE_RATE)
+            else:
+                import whisper
+                chunk_audio = whisper.load_audio(chunk["path"])
             for seg in chunk["speech_boundary"]:
                 start, end = seg["start"], seg["end"],
-                audio = whisper.load_audio(chunk["path"])
-                audio = audio[start:end]
-
-                asr_result = self._transcribe_wav(audio)
-                if not asr_result:
-                    chunk["asr_result"] = {}
-                    continue
-                item = [{"start": seg["start"], "end": seg["end"], "text": seg["text"]} for seg in asr_result]
-                chunk_asr.append(item)
-            chunk["asr_result"] = chunk_asr
+                pieces.append(chunk_audio[start:end])
+                owners.append(key)
+
+        audio_s = sum(len(piece) for piece in pieces) / SAMPLE_RATE
+        with span("asr.transcribe", chunk=list(chunks_json), audio_s=audio_s) as record:
+            if self.batch_size > 1:
+                asr_results = self._transcribe_packed(pieces, owners)
+            else:
+                asr_results = [self._transcribe_wav(audio, key) for audio, key in zip(pieces, owners)]
+            record["counts"]["segments"] = sum(len(result) for result in asr_results)
+            record["counts"]["characters"] = sum(len(seg["text"]) for result in asr_results for seg in result)
+
+        for chunk in chunks_json.values():
+            chunk["asr_result"] = []
+        for key, asr_result in zip(owners, asr_results):
+            if not asr_result:
+                continue
+            item = [{"start": seg["start"], "end": seg["end"], "text": seg["text"]} for seg in asr_result]
+            chunks_json[key]["asr_result"].append(item)
 
         if save and output_dir is not None:
             write_json(chunks_json, output_dir)
@@ -0,0 +1,233 @@
+import os
+import shutil
+import tempfile
+import threading
+import wave
+from math import gcd
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from pydub import AudioSegment
+
+from src.profiling import span
+
+RESAMPLE_CONTEXT = 1024 # input samples on each side of a block, covers the resampling filter
+
+
+def ms_to_samples(ms: float, sample_rate: int) -> int:
+    return int(ms * sample_rate / 1000)
+
+def as_float32(audio) -> np.ndarray:
+    """
+    `audio` as a contiguous 1-d float32 array, copied only if its dtype or layout differ.
+    Lists, such as results restored from older JSON artifacts, are converted.
+    """
+    return np.ascontiguousarray(audio, dtype=np.float32).reshape(-1)
+
+def empty_audio() -> np.ndarray:
+    return np.zeros(0, dtype=np.float32)
+
+def join_audio(parts: Sequence[np.ndarray]) -> np.ndarray:
+    """
+    Joins audio parts into one preallocated float32 buffer. A single part is returned as is.
+    """
+    if len(parts) == 1:
+        return as_float32(parts[0])
+    out = np.empty(sum(len(part) for part in parts), dtype=np.float32)
+    offset = 0
+    for part in parts:
+        out[offset:offset + len(part)] = part
+        offset += len(part)
+    return out
+
+def resample(audio: np.ndarray, orig_rate: int, target_rate: int) -> np.ndarray:
+    if orig_rate == target_rate:
+        return audio
+    import torch
+    import torchaudio.functional as AF
+
+    resampled = AF.resample(torch.from_numpy(np.ascontiguousarray(audio)), orig_rate, target_rate)
+    return resampled.numpy()
+
+def resample_blocks(
+    audio: np.ndarray, orig_rate: int, target_rate: int, out: np.ndarray, block_size: int = 1 << 20
+) -> np.ndarray:
+    """
+    Resamples `audio` into the preallocated `out` block by block, so neither needs to be resident.
+    Blocks start at multiples of the reduced input period and overlap by `RESAMPLE_CONTEXT` samples,
+    which keeps the result equal to a single-pass resample.
+    """
+    g = gcd(orig_rate, target_rate)
+    up, down = target_rate // g, orig_rate // g
+    block_size = max(1, block_size // down) * down
+    context = max(1, RESAMPLE_CONTEXT // down) * down
+    n = len(audio)
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        lo, hi = max(0, start - context), min(n, end + context)
+        resampled = resample(audio[lo:hi], orig_rate, target_rate)
+        out_start = start * up // down
+        out_end = -(-end * up // down)
+        offset = (start - lo) * up // down
+        out[out_start:out_end] = resampled[offset:offset + out_end - out_start]
+    return out
+
+def to_pcm(buffer: np.ndarray, sample_width: int = 2) -> np.ndarray:
+    """
+    Float audio in [-1, 1) to PCM as stored in WAV files, 8-bit PCM is unsigned.
+    """
+    scale = float(1 << (8 * sample_width - 1))
+    dtype = {1: np.int8, 2: np.int16, 4: np.int32}[sample_width]
+    bounds = np.iinfo(dtype)
+    pcm = np.clip(np.rint(np.asarray(buffer, dtype=np.float64) * scale), bounds.min, bounds.max)
+    if sample_width == 1:
+        return (pcm + 128).astype(np.uint8)
+    return pcm.astype(dtype)
+
+def to_audiosegment(buffer: np.ndarray, sample_rate: int, sample_width: int = 2) -> AudioSegment:
+    pcm = to_pcm(buffer, sample_width)
+    if sample_width == 1: # pydub keeps 8-bit samples signed
+        pcm = (pcm.astype(np.int16) - 128).astype(np.int8)
+    return AudioSegment(
+        pcm.tobytes(),
+        frame_rate=sample_rate,
+        sample_width=sample_width,
+        channels=buffer.shape[1],
+    )
+
+
+class AudioStore:
+    """
+    Decoded audio of a single input file, shared by all pipeline stages.
+
+    The file is decoded once. Mono copies at other sample rates (16 kHz for VAD/ASR)
+    are resampled once on first request and cached, stages take views by sample offset.
+    With `mmap_dir`, WAV input is decoded block by block into memory-mapped files,
+    so long inputs do not have to be resident.
+
+    Args:
+        path (str): Path to the audio file.
+        mmap_dir (Optional[str]): Directory for memory-mapped sample buffers.
+        block_size (int): Frames decoded/resampled at once when memory-mapped.
+    """
+
+    def __init__(self, path: str, mmap_dir: Optional[str] = None, block_size: int = 1 << 20):
+        self.path = path
+        self.block_size = block_size
+        self._mmap_dir = None
+        if mmap_dir is not None:
+            os.makedirs(mmap_dir, exist_ok=True)
+            self._mmap_dir = tempfile.mkdtemp(dir=mmap_dir)
+        self._segment = None
+        self._mono: Dict[int, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+        if self._mmap_dir is None or not self._decode_wav(path):
+            segment = AudioSegment.from_file(path)
+            self._segment = segment
+            self.sample_rate = segment.frame_rate
+            self.channels = segment.channels
+            self.sample_width = segment.sample_width
+            self.len_ms = len(segment)
+
+            samples = np.array(segment.get_array_of_samples(), dtype=np.float32)
+            samples /= float(1 << (8 * self.sample_width - 1))
+            self.samples = samples.reshape(-1, self.channels)
+
+    def _buffer(self, name: str, shape: Tuple) -> np.ndarray:
+        if self._mmap_dir is None:
+            return np.empty(shape, dtype=np.float32)
+        return np.lib.format.open_memmap(os.path.join(self._mmap_dir, f"{name}.npy"), "w+", np.float32, shape)
+
+    def _decode_wav(self, path: str) -> bool:
+        try:
+            reader = wave.open(path, "rb")
+        except (wave.Error, EOFError):
+            return False
+        with reader:
+            if reader.getsampwidth() not in (2, 4):
+                return False
+            self.sample_rate = reader.getframerate()
+            self.channels = reader.getnchannels()
+            self.sample_width = reader.getsampwidth()
+            n_frames = reader.getnframes()
+            self.len_ms = round(1000 * n_frames / self.sample_rate)
+            self.samples = self._buffer("native", (n_frames, self.channels))
+            dtype = np.int16 if self.sample_width == 2 else np.int32
+            scale = float(1 << (8 * self.sample_width - 1))
+            position = 0
+            while position < n_frames:
+                block = np.frombuffer(reader.readframes(self.block_size), dtype=dtype)
+                if not block.size:
+                    break
+                block = block.reshape(-1, self.channels)
+                self.samples[position:position + len(block)] = block / scale
+                position += len(block)
+        return True
+
+    @property
+    def segment(self) -> AudioSegment:
+        """
+        The original audio as a pydub AudioSegment, built from the samples on first use.
+        """
+        if self._segment is None:
+            self._segment = to_audiosegment(self.samples, self.sample_rate, self.sample_width)
+        return self._segment
+
+    def mono(self, sample_rate: int) -> np.ndarray:
+        """
+        Returns the whole signal downmixed to mono at the requested sample rate.
+        """
+        with self._lock:
+            if sample_rate not in self._mono:
+                if self.sample_rate in self._mono:
+                    native = self._mono[self.sample_rate]
+                elif self.channels == 1:
+                    native = self.samples[:, 0]
+                    self._mono[self.sample_rate] = native
+                else:
+                    native = self._buffer(f"mono_{self.sample_rate}", (len(self.samples),))
+                    for b in range(0, len(native), self.block_size):
+                        native[b:b + self.block_size] = self.samples[b:b + self.block_size].mean(axis=1)
+                    self._mono[self.sample_rate] = native
+                if sample_rate != self.sample_rate:
+                    out_len = -(-len(native) * sample_rate // self.sample_rate)
+                    out = self._buffer(f"mono_{sample_rate}", (out_len,))
+                    with span("audio.resample", audio_s=len(native) / self.sample_rate):
+                        self._mono[sample_rate] = resample_blocks(
+                            native, self.sample_rate, sample_rate, out, block_size=self.block_size
+                        )
+            return self._mono[sample_rate]
+
+    def view(self, sample_rate: int, start: int, end: int) -> np.ndarray:
+        """
+        Returns a zero-copy view of the mono signal, `start` and `end` are sample offsets.
+        """
+        return self.mono(sample_rate)[start:end]
+
+    def chunk(self, chunk: Dict, sample_rate: int = 16000) -> np.ndarray:
+        """
+        Returns a zero-copy view of the chunk described by its `orig_seg` (ms).
+        """
+        start = ms_to_samples(chunk["orig_seg"]["start"], sample_rate)
+        end = ms_to_samples(chunk["orig_seg"]["end"], sample_rate)
+        return self.view(sample_rate, start, end)
+
+    def chunk_segment(self, chunk: Dict) -> AudioSegment:
+        return self.segment[chunk["orig_seg"]["start"]:chunk["orig_seg"]["end"]]
+
+    def export_chunk(self, chunk: Dict, output_dir: str, name: str) -> str:
+        os.makedirs(output_dir, exist_ok=True)
+        out_path = os.path.join(output_dir, name)
+        self.chunk_segment(chunk).export(out_path, format="wav")
+        return out_path
+
+    def close(self) -> None:
+        """
+        Drops cached buffers and removes memory-mapped files.
+        """
+        self._mono.clear()
+        self.samples = None
+        self._segment = None
+        if self._mmap_dir is not None:
+            shutil.rmtree(self._mmap_dir, ignore_errors=True)
@@ -0,0 +1,68 @@
+"""
+CPU inference backends for the ASR and MT models: dynamic int8 quantization of the linear layers
+and ONNX Runtime export, with converted models cached on disk so the conversion runs once.
+"""
+import os
+import re
+from typing import Any, Callable, Optional
+
+from src.artifacts import stage_key
+
+
+def converted_path(models_dir: Optional[str], name: str, backend: str, *versions: Any) -> Optional[str]:
+    """
+    Cache path of a converted model. The library versions are part of the key, as the conversions
+    (pickled quantized modules, exported graphs) are not portable between them.
+    """
+    if models_dir is None:
+        return None
+    safe_name = re.sub(r"[^\w.-]+", "_", name)
+    return os.path.join(models_dir, f"{safe_name}-{backend}-{stage_key(name, backend, *versions)[:12]}")
+
+def quantize_int8(model):
+    """
+    Dynamic int8 quantization of all linear layers: int8 weights, activations quantized on the fly.
+    """
+    import torch
+    from torch import nn
+    for module in model.modules():
+        # quantize_dynamic matches exact types only, so subclasses such as whisper's Linear
+        # (which casts its weights to the input dtype) are turned back into nn.Linear
+        if isinstance(module, nn.Linear) and type(module) is not nn.Linear:
+            module.__class__ = nn.Linear
+    return torch.ao.quantization.quantize_dynamic(model.eval(), {nn.Linear}, dtype=torch.qint8)
+
+def load_int8(build: Callable[[], Any], path: Optional[str]):
+    """
+    Loads the quantized model from `path`, or builds the fp32 model with `build`, quantizes it
+    and saves it to `path`. Loading the saved model never holds the fp32 weights in memory.
+    """
+    import torch
+    file_path = f"{path}.pt" if path else None
+    if file_path and os.path.exists(file_path):
+        return torch.load(file_path, weights_only=False)
+    model = quantize_int8(build())
+    if file_path:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.{os.getpid()}.tmp"
+        torch.save(model, tmp_path)
+        os.replace(tmp_path, file_path)
+    return model
+
+def load_onnx_seq2seq(model_name: str, path: Optional[str]):
+    """
+    Loads a seq2seq model exported to ONNX Runtime (encoder, decoder and decoder with past) from `path`,
+    or exports it from the PyTorch checkpoint and saves it to `path`.
+    """
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError as e:
+        raise ImportError("The onnx backend needs `optimum[onnxruntime]`") from e
+    if path and os.path.isdir(path):
+        return ORTModelForSeq2SeqLM.from_pretrained(path)
+    model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True)
+    if path:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        model.save_pretrained(tmp_path)
+        os.replace(tmp_path, path)
+    return model
@@ -0,0 +1,341 @@
+"""
+Batch dubbing of many files (e.g. a whole season) with one set of loaded models.
+
+Files are taken in waves of `batch.files_in_flight`. Within a wave every stage runs over the chunks
+of all its files in cross-file groups of `batch.group_size` chunks, so ASR windows, MT batches and the
+TTS worker pool are filled from several episodes instead of running short at the end of each file.
+Every file is mixed and written as soon as its last chunk is synthesized. Per-chunk results go to the
+same artifacts as in `VideoDubPipe.transform`, so an interrupted batch resumes where it stopped.
+
+Usage:
+    python -m src.batch --config config/config.yaml --inputs ../data/season1 --output-dir ../data/season1_dubbed
+    python -m src.batch --inputs manifest.json --output-dir ../data/dubbed
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+import traceback
+from typing import Callable, Dict, List, Optional
+
+from src.pipeline import VideoDubPipe
+from src.profiling import span
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".m4a")
+
+
+def collect_inputs(inputs: str, output_dir: str) -> List[Dict]:
+    """
+    Lists the files to dub: the audio files of a directory, or the entries of a manifest, either a JSON
+    list of {"input", "output"} objects or a text file with an input path and an optional output path per line.
+    Relative manifest paths are relative to the manifest.
+
+    Returns:
+        List[Dict]: {"input", "output"} for every file, the output is `<output_dir>/<name>_dubbed.wav` if not given.
+    """
+    if os.path.isdir(inputs):
+        entries = [
+            {"input": os.path.join(inputs, name)}
+            for name in sorted(os.listdir(inputs)) if name.lower().endswith(AUDIO_EXTENSIONS)
+        ]
+    else:
+        base_dir = os.path.dirname(os.path.abspath(inputs))
+        with open(inputs, "r") as f:
+            if inputs.endswith(".json"):
+                entries = json.load(f)
+            else:
+                entries = []
+                for line in f:
+                    parts = line.split()
+                    if parts and not parts[0].startswith("#"):
+                        entries.append({"input": parts[0], "output": parts[1] if len(parts) > 1 else None})
+        for entry in entries:
+            for field in ("input", "output"):
+                if entry.get(field):
+                    entry[field] = os.path.join(base_dir, entry[field])
+
+    files = []
+    for entry in entries:
+        name = os.path.splitext(os.path.basename(entry["input"]))[0]
+        output = entry.get("output") or os.path.join(output_dir, f"{name}_dubbed.wav")
+        files.append({"input": os.path.abspath(entry["input"]), "output": os.path.abspath(output)})
+    outputs = [f["output"] for f in files]
+    if len(set(outputs)) != len(outputs):
+        raise ValueError("Batch inputs have duplicate output paths, set the outputs in a manifest")
+    return files
+
+def work_dir(output_dir: str, input_path: str) -> str:
+    """
+    Directory of the intermediate results of `input_path`, `<output_dir>/work/<name>-<hash of the input path>`,
+    so inputs with the same name in different directories do not share it.
+    """
+    name = os.path.splitext(os.path.basename(input_path))[0]
+    digest = hashlib.sha256(os.path.abspath(input_path).encode()).hexdigest()[:8]
+    return os.path.join(output_dir, "work", f"{name}-{digest}")
+
+
+class _BatchFile:
+    def __init__(self, index: int, input_path: str, output_path: str, work_dir: str):
+        self.index = index
+        self.input = input_path
+        self.output = output_path
+        self.work_dir = work_dir
+        self.name = os.path.splitext(os.path.basename(input_path))[0]
+        self.store = None
+        self.artifacts = None
+        self.keys = None
+        self.chunks = {}
+        self.results = {} # chunk id -> result of the current stage
+        self.audio_s = 0.0
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.traceback = None
+
+    @property
+    def live(self) -> bool:
+        return self.error is None and self.finished is None
+
+
+class BatchDubber:
+    """
+    Dubs a list of files on one VideoDubPipe with cross-file scheduling of the ASR, MT and TTS stages.
+
+    Args:
+        pipeline (VideoDubPipe): Pipeline with the shared models.
+        files_in_flight (Optional[int]): Files processed together, bounds memory. `batch.files_in_flight` if None.
+        group_size (Optional[int]): Chunks per model call, across files. `batch.group_size` if None.
+    """
+
+    def __init__(self, pipeline: VideoDubPipe, files_in_flight: Optional[int] = None, group_size: Optional[int] = None):
+        self.pipeline = pipeline
+        self.files_in_flight = files_in_flight or pipeline.cfg["batch"]["files_in_flight"]
+        self.group_size = group_size or pipeline.cfg["batch"]["group_size"]
+        self.stage_s = {}
+
+    def _fail(self, item: _BatchFile, error: Exception) -> None:
+        item.error = f"{type(error).__name__}: {error}"
+        item.traceback = traceback.format_exc()
+        if item.store is not None:
+            item.store.close()
+            item.store = None
+        item.results = {}
+        print(f"{item.name}: failed, {item.error}")
+
+    def _prepare(self, item: _BatchFile) -> None:
+        pipe = self.pipeline
+        item.started = time.perf_counter()
+        item.store = pipe._load_audio(item.input)
+        item.audio_s = item.store.len_ms / 1000
+        item.artifacts = pipe._artifacts(item.work_dir)
+        item.keys = pipe._stage_keys(item.input)
+        item.chunks, _, _ = pipe._chunk_stage(item.artifacts, item.keys["chunks"], item.store, item.work_dir)
+        print(f"{item.name}: {item.audio_s:.1f} s, {len(item.chunks)} chunks")
+
+    def _call(self, fn: Callable[[Dict], Dict], group: List) -> Dict:
+        return fn({(item.index, i): item.chunks[i] for item, i in group})
+
+    def _run_group(self, stage: str, fn: Callable[[Dict], Dict], group: List) -> None:
+        """
+        Runs one cross-file group. If it fails, the files of the group are run separately,
+        so that one broken file does not fail the others.
+        """
+        items = list({item.index: item for item, _ in group}.values())
+        start = time.perf_counter()
+        try:
+            with span(f"batch.{stage}", chunk=[item.index for item in items], chunks=len(group)):
+                results = self._call(fn, group)
+        except Exception as e:
+            if len(items) == 1:
+                self._fail(items[0], e)
+                return
+            results = {}
+            for item in items:
+                try:
+                    results.update(self._call(fn, [(it, i) for it, i in group if it is item]))
+                except Exception as item_error:
+                    self._fail(item, item_error)
+        self.stage_s[stage] = self.stage_s.get(stage, 0.0) + time.perf_counter() - start
+
+        for item, i in group:
+            if item.error is None:
+                value = results[(item.index, i)]
+                item.artifacts.save_chunk(stage, item.keys[stage], i, value)
+                item.results[i] = value
+
+    def _run_stage(
+        self, items: List[_BatchFile], stage: str, field: Optional[str], fn: Callable[[Dict], Dict],
+        on_group: Optional[Callable[[List[_BatchFile]], None]] = None,
+    ) -> None:
+        """
+        Runs a stage over the pending chunks of all `items`, file after file in groups of `group_size`
+        chunks that span file boundaries. Results are stored per file like `VideoDubPipe._run_stage`.
+        """
+        resume = self.pipeline.cfg["cache"]["resume"]
+        pending = []
+        for item in items:
+            if not item.live:
+                continue
+            item.results = item.artifacts.load_chunks(stage, item.keys[stage]) if resume else {}
+            if item.results:
+                print(f"{item.name} {stage}: {len(item.results)}/{len(item.chunks)} chunks restored")
+            pending.extend((item, i) for i in item.chunks if i not in item.results)
+        if on_group is not None:
+            on_group(items)
+
+        for b in range(0, len(pending), self.group_size):
+            group = [(item, i) for item, i in pending[b:b + self.group_size] if item.live]
+            if group:
+                self._run_group(stage, fn, group)
+                if on_group is not None:
+                    on_group(items)
+
+        for item in items:
+            if item.error is None: # files mixed during the stage are finished but complete
+                item.artifacts.mark_done(stage, item.keys[stage])
+            if item.live and field is not None:
+                for i, chunk in item.chunks.items():
+                    chunk[field] = item.results[i]
+
+    def _mix_ready(self, items: List[_BatchFile]) -> None:
+        """
+        Mixes and writes every file whose chunks are all synthesized.
+        """
+        pipe = self.pipeline
+        for item in items:
+            if not item.live or len(item.results) < len(item.chunks):
+                continue
+            try:
+                mixer = pipe._mixer(item.store, item.output)
+                fits = pipe._fit_all(item.chunks, item.results)
+                for (i, chunk), fit in zip(item.chunks.items(), fits):
+                    pipe._mix_chunk(mixer, i, chunk, item.results.pop(i), fit)
+                pipe._finish(item.store, mixer, item.output)
+            except Exception as e:
+                self._fail(item, e)
+                continue
+            item.store = None
+            item.finished = time.perf_counter()
+            wall_s = item.finished - item.started
+            print(f"{item.name}: written {item.output}, {item.audio_s:.1f} s audio in {wall_s:.2f} s")
+
+    def _run_wave(self, items: List[_BatchFile]) -> None:
+        pipe = self.pipeline
+        for item in items:
+            try:
+                self._prepare(item)
+            except Exception as e:
+                self._fail(item, e)
+        stores = {item.index: item.store for item in items}
+
+        print(f"Transcribe {len(items)} files...")
+        self._run_stage(
+            items, "asr", "asr_result",
+            lambda group: pipe._transcribe(group, {key: stores[key[0]] for key in group}),
+        )
+        print(f"Translate {len(items)} files...")
+        self._run_stage(items, "mt", "translated_text", pipe._translate)
+        print(f"TTS step for {len(items)} files...")
+        self._run_stage(items, "tts", None, pipe._synthesize, on_group=self._mix_ready)
+
+    def run(self, files: List[Dict], output_dir: str) -> Dict:
+        """
+        Dubs `files` ({"input", "output"} entries, see `collect_inputs`), keeping intermediate results
+        in `work_dir(output_dir, input)`.
+
+        Returns:
+            Dict: report with per-file and total audio duration, wall time and throughput.
+        """
+        items = []
+        for index, f in enumerate(files):
+            items.append(_BatchFile(index, f["input"], f["output"], work_dir(output_dir, f["input"])))
+        self.pipeline.start_fit_report()
+        start = time.perf_counter()
+        with span("batch.run", files=len(items)) as record:
+            for w in range(0, len(items), self.files_in_flight):
+                wave = items[w:w + self.files_in_flight]
+                print(f"Batch: files {w + 1}-{w + len(wave)} of {len(items)}")
+                self._run_wave(wave)
+            record["audio_s"] = sum(item.audio_s for item in items)
+        return self._report(items, time.perf_counter() - start)
+
+    def _report(self, items: List[_BatchFile], wall_s: float) -> Dict:
+        files = []
+        for item in items:
+            entry = {"input": item.input, "output": item.output, "audio_s": round(item.audio_s, 3), "chunks": len(item.chunks)}
+            if item.finished is not None:
+                file_wall_s = item.finished - item.started
+                entry.update(
+                    status="done",
+                    wall_s=round(file_wall_s, 3),
+                    throughput=round(item.audio_s / file_wall_s, 3) if file_wall_s else None,
+                )
+            else:
+                entry.update(status="failed", error=item.error or "not finished", traceback=item.traceback)
+            files.append(entry)
+
+        done = [f for f in files if f["status"] == "done"]
+        audio_s = sum(f["audio_s"] for f in done)
+        mt_cache = self.pipeline.mt_model.cache_stats()
+        tts_cache = self.pipeline.tts_model.audio_cache
+        return {
+            "files": files,
+            "total": {
+                "files": len(files),
+                "done": len(done),
+                "failed": len(files) - len(done),
+                "audio_s": round(audio_s, 3),
+                "wall_s": round(wall_s, 3),
+                "throughput": round(audio_s / wall_s, 3) if wall_s else None, # s of audio per s
+                "rtf": round(wall_s / audio_s, 4) if audio_s else None,
+                "stage_s": {stage: round(t, 3) for stage, t in self.stage_s.items()},
+                "mt_cache": mt_cache,
+                "tts_cache": tts_cache.stats() if tts_cache is not None else None,
+                "tts_fit": self.pipeline.fit_report(),
+            },
+        }
+
+
+def print_report(report: Dict) -> None:
+    for f in report["files"]:
+        name = os.path.basename(f["input"])
+        if f["status"] == "done":
+            print(f"{name:32s} {f['audio_s']:9.1f} s audio {f['wall_s']:9.2f} s  x{f['throughput']:.2f}")
+        else:
+            print(f"{name:32s} {f['audio_s']:9.1f} s audio    failed  {f['error']}")
+    total = report["total"]
+    throughput = f"x{total['throughput']:.2f}" if total["throughput"] is not None else "-"
+    print(
+        f"Total: {total['done']}/{total['files']} files, {total['audio_s']:.1f} s audio "
+        f"in {total['wall_s']:.2f} s, {throughput} real time"
+    )
+    print("Stages: " + ", ".join(f"{stage} {t:.2f} s" for stage, t in total["stage_s"].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--inputs", required=True, help="directory with audio files or a manifest (.json or .txt)")
+    parser.add_argument("--output-dir", required=True)
+    parser.add_argument("--files-in-flight", type=int, default=None)
+    parser.add_argument("--group-size", type=int, default=None)
+    parser.add_argument("--report", default=None, help="report path, <output-dir>/batch_report.json by default")
+    parser.add_argument("--no-warmup", action="store_true", help="load models on first use instead of at start")
+    args = parser.parse_args()
+
+    files = collect_inputs(args.inputs, args.output_dir)
+    print(f"Batch of {len(files)} files")
+    pipeline = VideoDubPipe(args.config)
+    if not args.no_warmup:
+        pipeline.warmup()
+    report = BatchDubber(pipeline, args.files_in_flight, args.group_size).run(files, args.output_dir)
+    print_report(report)
+    report_path = args.report or os.path.join(args.output_dir, "batch_report.json")
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
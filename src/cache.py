@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+class TranslationCache:
+    """
+    Persistent translation memory backed by SQLite.
+
+    Args:
+        path (str): Path to the SQLite database file.
+        namespace (str): Model name and generation settings, part of every key.
+        max_entries (int): Least recently used entries above this limit are evicted.
+    """
+
+    def __init__(self, path: str, namespace: str, max_entries: int = 100_000):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations "
+            "(key TEXT PRIMARY KEY, source TEXT, target TEXT, used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS translations_used ON translations (used)")
+        self._conn.commit()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\0{normalize_text(text)}".encode()).hexdigest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[str]]:
+        """
+        Returns cached translations, None for every miss.
+        """
+        keys = [self._key(t) for t in texts]
+        found = {}
+        with self._lock:
+            for b in range(0, len(keys), 500):
+                batch = keys[b:b + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, target FROM translations WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update(rows)
+            now = time.time()
+            self._touched.update((k, now) for k in found)
+            if len(self._touched) >= 1000:
+                self._flush_touched()
+        result = [found.get(k) for k in keys]
+        hits = sum(r is not None for r in result)
+        self.hits += hits
+        self.misses += len(result) - hits
+        return result
+
+    def put_many(self, texts: List[str], translations: List[str]) -> None:
+        now = time.time()
+        rows = [(self._key(t), t, tr, now) for t, tr in zip(texts, translations)]
+        with self._lock:
+            self._flush_touched()
+            self._conn.executemany("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)", rows)
+            count = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM translations WHERE key IN "
+                    "(SELECT key FROM translations ORDER BY used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def _flush_touched(self) -> None:
+        # recency updates of hits are written lazily, so a lookup does not pay for a commit
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE translations SET used = ? WHERE key = ?", [(t, k) for k, t in self._touched.items()]
+            )
+            self._conn.commit()
+            self._touched.clear()
+
+    def get(self, text: str) -> Optional[str]:
+        return self.get_many([text])[0]
+
+    def put(self, text: str, translation: str) -> None:
+        self.put_many([text], [translation])
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_touched()
+            self._conn.close()
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class AudioCache:
+    """
+    Content-addressed store of synthesized float32 audio, one `.npy` file per entry.
+
+    Args:
+        directory (str): Cache directory.
+        max_bytes (int): Least recently used files are removed once the directory grows above this size.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 2 << 30):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._size = sum(e.stat().st_size for e in os.scandir(directory) if e.name.endswith(".npy"))
+
+    @staticmethod
+    def key(**fields) -> str:
+        return hashlib.sha256(json.dumps(fields, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        path = self._path(key)
+        try:
+            audio = np.load(path)
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return audio
+
+    def put(self, key: str, audio: np.ndarray) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(audio, dtype=np.float32))
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size += os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        entries = sorted(
+            (e for e in os.scandir(self.directory) if e.name.endswith(".npy")),
+            key=lambda e: e.stat().st_mtime,
+        )
+        self._size = sum(e.stat().st_size for e in entries)
+        for entry in entries:
+            if self._size <= self.max_bytes:
+                break
+            self._size -= entry.stat().st_size
+            os.remove(entry.path)
+
+    def stats(self) -> Dict:
+        return {"hits": self.hits, "misses": self.misses, "bytes": self._size}
@@ -0,0 +1,236 @@
+"""
+Offline quality evaluation of finished dubbing runs from their stored artifacts, without running ASR, MT or TTS.
+
+For every synthesized chunk it reports the speaker similarity to the reference voice, the stretch ratio
+of its placement (as in the mix, synthesized / placed duration) and the duration error against the
+original speech. Speaker embeddings of all chunks are computed in batches, the reference embedding
+comes from the cached conditioning latents, and the similarities of all chunks to the reference and
+to each other are one matrix product. The config must be the one of the run, as it selects the artifacts.
+
+Streaming runs do not store their chunk split, so for them the input is split into chunks again,
+which runs silence detection and the VAD.
+
+Usage:
+    python -m src.evaluation --config config/config.yaml --inputs ../data/audio.wav --output-dir ../data/output
+    python -m src.evaluation --inputs ../data/season1 --output-dir ../data/season1_dubbed --min-similarity 0.75
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.audio import as_float32
+from src.batch import AUDIO_EXTENSIONS, collect_inputs, work_dir
+from src.pipeline import VideoDubPipe
+from src.profiling import span
+from src.tts import speech_slot
+
+
+def similarity_matrix(a: np.ndarray, b: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Cosine similarity of every row of `a` to every row of `b` (of `a` itself if None), (len(a), len(b)).
+    Rows with NaN give NaN similarities.
+    """
+    a = np.asarray(a, dtype=np.float32).reshape(len(a), -1)
+    b = a if b is None else np.asarray(b, dtype=np.float32).reshape(len(b), -1)
+    a_norm = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b_norm = a_norm if b is a else b / np.linalg.norm(b, axis=1, keepdims=True)
+    return a_norm @ b_norm.T
+
+def _summary(values: np.ndarray) -> Optional[Dict]:
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return None
+    p10, p50, p90 = np.percentile(values, [10, 50, 90])
+    return {
+        "mean": round(float(values.mean()), 4),
+        "min": round(float(values.min()), 4),
+        "p10": round(float(p10), 4),
+        "p50": round(float(p50), 4),
+        "p90": round(float(p90), 4),
+        "max": round(float(values.max()), 4),
+    }
+
+
+class Evaluator:
+    """
+    Scores finished runs of `pipeline`. The TTS model is loaded for its speaker encoder, and the VAD
+    only for runs without a stored chunk split.
+
+    Args:
+        pipeline (VideoDubPipe): Pipeline with the config of the evaluated runs.
+        batch_size (Optional[int]): Clips per speaker encoder call. `evaluation.batch_size` if None.
+        max_s (Optional[float]): Clips are cut to this many seconds. `evaluation.max_s` if None.
+    """
+
+    def __init__(self, pipeline: VideoDubPipe, batch_size: Optional[int] = None, max_s: Optional[float] = None):
+        self.pipeline = pipeline
+        self.batch_size = batch_size or pipeline.cfg["evaluation"]["batch_size"]
+        self.max_s = max_s or pipeline.cfg["evaluation"]["max_s"]
+        self._reference = None
+
+    @property
+    def reference(self) -> np.ndarray:
+        if self._reference is None:
+            self._reference = self.pipeline.tts_model.speaker_embedding(self.pipeline.speaker_path)
+        return self._reference
+
+    def _load_run(self, path_to_wav: str, output_dir: str):
+        pipe = self.pipeline
+        keys = pipe._stage_keys(path_to_wav)
+        for run_dir in (output_dir, work_dir(output_dir, path_to_wav)): # of `transform` and of `BatchDubber`
+            artifacts = pipe._artifacts(run_dir)
+            if artifacts.is_done("tts", keys["tts"]):
+                break
+        else:
+            raise FileNotFoundError(f"No finished TTS stage of {path_to_wav} in the artifacts of {output_dir}")
+        restored = pipe._restore_chunks(artifacts, keys["chunks"])
+        if restored is None: # streaming runs do not store the chunk split
+            print(f"{os.path.basename(path_to_wav)}: no stored chunks, splitting the input again")
+            store = pipe._load_audio(path_to_wav)
+            try:
+                restored = pipe._chunk_stage(artifacts, keys["chunks"], store, run_dir)
+            finally:
+                store.close()
+        chunks = restored[0]
+        tts_results = artifacts.load_chunks("tts", keys["tts"])
+        missing = [i for i in chunks if i not in tts_results]
+        if missing:
+            raise FileNotFoundError(f"TTS artifacts of {path_to_wav} miss chunks {missing}")
+        return chunks, tts_results
+
+    def evaluate(self, path_to_wav: str, output_dir: str) -> Dict:
+        """
+        Evaluates the run of `path_to_wav` whose artifacts are in `cache.dir`, or under `output_dir` without it.
+
+        Returns:
+            Dict: summaries over the chunks and the metrics of every chunk.
+        """
+        pipe = self.pipeline
+        with span("evaluation.file") as record:
+            chunks, tts_results = self._load_run(path_to_wav, output_dir)
+            ids = list(chunks)
+            record["counts"]["chunks"] = len(ids)
+            audios = [as_float32(tts_results[i]) for i in ids]
+            embeddings = pipe.tts_model.speaker_embeddings(
+                audios, pipe.sample_rate, batch_size=self.batch_size, max_s=self.max_s
+            )
+            # column 0 is the reference voice, the rest the chunks themselves
+            similarity = similarity_matrix(embeddings, np.vstack([self.reference[None], embeddings]))
+            to_reference = similarity[:, 0]
+            pairwise = similarity[:, 1:][~np.eye(len(ids), dtype=bool)] if len(ids) > 1 else np.array([])
+
+            fits = pipe._fit_all(chunks, tts_results)
+            synth_s = np.array([audio.shape[0] for audio in audios], dtype=np.float64) / pipe.sample_rate
+            record["audio_s"] = float(synth_s.sum())
+            slot_s = np.array([speech_slot(chunks[i]) for i in ids])
+            placed_s = np.array([np.round(f["end"], 3) - np.round(f["start"], 3) if f else 0.0 for f in fits])
+            spoken = (synth_s > 0) & (placed_s > 0)
+            stretch_ratio = np.full(len(ids), np.nan)
+            stretch_ratio[spoken] = synth_s[spoken] / placed_s[spoken]
+            duration_error = np.where((synth_s > 0) & (slot_s > 0), synth_s - slot_s, np.nan)
+
+        segments = [
+            {
+                "chunk": i,
+                "start_ms": chunks[i]["orig_seg"]["start"],
+                "end_ms": chunks[i]["orig_seg"]["end"],
+                "synthesized_s": round(float(synth_s[k]), 3),
+                "slot_s": round(float(slot_s[k]), 3),
+                "similarity": None if np.isnan(to_reference[k]) else round(float(to_reference[k]), 4),
+                "stretch_ratio": None if np.isnan(stretch_ratio[k]) else round(float(stretch_ratio[k]), 4),
+                "duration_error_s": None if np.isnan(duration_error[k]) else round(float(duration_error[k]), 3),
+            }
+            for k, i in enumerate(ids)
+        ]
+        return {
+            "input": path_to_wav,
+            "chunks": len(ids),
+            "similarity": _summary(to_reference),
+            "consistency": _summary(pairwise),
+            "stretch_ratio": _summary(stretch_ratio),
+            "abs_duration_error_s": _summary(np.abs(duration_error)),
+            "segments": segments,
+        }
+
+    def run(self, files: List[Dict], output_dir: str, min_similarity: Optional[float] = None) -> Dict:
+        """
+        Evaluates every file of `collect_inputs`. A file passes if its mean speaker similarity
+        is at least `min_similarity` (`evaluation.min_similarity` if None, no gate if that is None too).
+        """
+        if min_similarity is None:
+            min_similarity = self.pipeline.cfg["evaluation"]["min_similarity"]
+        results = []
+        for f in files:
+            try:
+                result = self.evaluate(f["input"], output_dir)
+            except Exception as e:
+                results.append({"input": f["input"], "status": "failed", "error": f"{type(e).__name__}: {e}"})
+                continue
+            mean = result["similarity"]["mean"] if result["similarity"] else None
+            passed = min_similarity is None or (mean is not None and mean >= min_similarity)
+            results.append({"status": "passed" if passed else "below", **result})
+        means = [r["similarity"]["mean"] for r in results if r.get("similarity")]
+        return {
+            "files": results,
+            "total": {
+                "files": len(results),
+                "passed": sum(r["status"] == "passed" for r in results),
+                "min_similarity": min_similarity,
+                "mean_similarity": round(float(np.mean(means)), 4) if means else None,
+            },
+        }
+
+
+def print_report(report: Dict) -> None:
+    for f in report["files"]:
+        name = os.path.basename(f["input"])
+        if f["status"] == "failed":
+            print(f"{name:32s} failed  {f['error']}")
+            continue
+        similarity, stretch = f["similarity"] or {}, f["stretch_ratio"] or {}
+        error = f["abs_duration_error_s"] or {}
+        print(
+            f"{name:32s} {f['chunks']:5d} chunks  similarity {similarity.get('mean', float('nan')):.3f} "
+            f"(p10 {similarity.get('p10', float('nan')):.3f})  stretch p90 {stretch.get('p90', float('nan')):.2f}  "
+            f"|duration error| p50 {error.get('p50', float('nan')):.2f} s  {f['status']}"
+        )
+    total = report["total"]
+    mean = total["mean_similarity"]
+    print(
+        f"Total: {total['passed']}/{total['files']} files passed, mean similarity "
+        f"{mean if mean is None else round(mean, 3)}, threshold {total['min_similarity']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--inputs", required=True, help="audio file, directory with audio files or a manifest")
+    parser.add_argument("--output-dir", required=True, help="output directory of the run, holds the artifacts without cache.dir")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--max-s", type=float, default=None)
+    parser.add_argument("--min-similarity", type=float, default=None)
+    parser.add_argument("--report", default=None, help="report path, <output-dir>/evaluation.json by default")
+    args = parser.parse_args()
+
+    if args.inputs.lower().endswith(AUDIO_EXTENSIONS):
+        files = [{"input": args.inputs}]
+    else:
+        files = collect_inputs(args.inputs, args.output_dir)
+    evaluator = Evaluator(VideoDubPipe(args.config), args.batch_size, args.max_s)
+    report = evaluator.run(files, args.output_dir, args.min_similarity)
+    print_report(report)
+    report_path = args.report or os.path.join(args.output_dir, "evaluation.json")
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    if report["total"]["passed"] < report["total"]["files"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,30 @@
+import hashlib
 import json
 import os
 import re
+import shutil
+import subprocess
 from datetime import datetime
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, List, Optional, Union
 
 import numpy as np
-import torch
-import torch.nn.functional as F
-import torchaudio
-from moviepy import AudioFileClip, VideoFileClip
 from pydub import AudioSegment, effects
 
+from src.audio import as_float32
+from src.profiling import span
+
+if TYPE_CHECKING: # torch, torchaudio and moviepy are imported where used, they are slow to import
+    import torch
+
 
 def split_by_punctuation(text: str):
     parts = re.split(r'(?<=[,\.!?])\s+', text)
     return [p.strip() for p in parts if p.strip()]
 
+def split_sentences(text: str):
+    parts = re.split(r'(?<=[\.!?])\s+', text)
+    return [p.strip() for p in parts if p.strip()]
+
 def split_long_string(text: str, cutoff = 182, indent=40):
     midpoint = len(text) // 2
     if midpoint >= cutoff:
@@ -28,40 +37,141 @@ def split_long_string(text: str, cutoff = 182, indent=40):
     else:
         return split_by_punctuation(text)
 
-def video_to_wav(src_path: str, output_path: str) -> None:
-    video = VideoFileClip(src_path)
-    video.audio.write_audiofile(output_path)
-
-def wav_to_video(video_path: str, wav_path: str, output_path: str) -> None:
-    video = VideoFileClip(video_path)
-    audio = AudioFileClip(wav_path)
-    video_with_audio = video.with_audio(audio)
-    video_with_audio.write_videofile(output_path, audio=True)
-
-def write_json(data: Dict, output_dir: str, filename: str = "asr_result"): # TODO: cannot write np.array
+# audio codec of the remuxed video by container, the video stream itself is copied
+REMUX_AUDIO_CODECS = {".webm": "libopus", ".ogv": "libvorbis", ".avi": "libmp3lame"}
+
+
+def ffmpeg_binary() -> Optional[str]:
+    """
+    Path to an ffmpeg executable: `FFMPEG_BINARY`, ffmpeg on PATH or the binary bundled with moviepy.
+    """
+    path = os.environ.get("FFMPEG_BINARY") or shutil.which("ffmpeg")
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return None
+
+def _run_ffmpeg(args: List[str]) -> bool:
+    """
+    Runs ffmpeg with `args`. Returns False if there is no ffmpeg or it fails, so the caller can fall back to moviepy.
+    """
+    ffmpeg = ffmpeg_binary()
+    if ffmpeg is None:
+        return False
+    try:
+        result = subprocess.run([ffmpeg, "-y", "-hide_banner", "-loglevel", "error", *args], capture_output=True, text=True)
+    except OSError as e:
+        print(f"ffmpeg not runnable, falling back to moviepy: {e}")
+        return False
+    if result.returncode != 0:
+        print(f"ffmpeg failed, falling back to moviepy: {result.stderr.strip()}")
+        return False
+    return True
+
+def video_to_wav(
+    src_path: str, output_path: str, sample_rate: Optional[int] = None, channels: Optional[int] = None
+) -> None:
+    """
+    Extracts the first audio track of a video to a 16-bit WAV file. With ffmpeg only the audio
+    stream is demuxed and decoded, video frames are skipped.
+
+    Args:
+        src_path (str): Video file.
+        output_path (str): Output WAV file.
+        sample_rate (Optional[int]): Output sample rate, the source rate if None.
+        channels (Optional[int]): Output channels, the source channels if None.
+    """
+    args = ["-i", src_path, "-map", "0:a:0", "-vn", "-sn", "-dn", "-c:a", "pcm_s16le"]
+    if sample_rate:
+        args += ["-ar", str(sample_rate)]
+    if channels:
+        args += ["-ac", str(channels)]
+    with span("media.extract_audio"):
+        if _run_ffmpeg(args + [output_path]):
+            return
+        from moviepy import VideoFileClip
+        video = VideoFileClip(src_path)
+        try:
+            video.audio.write_audiofile(
+                output_path, fps=sample_rate or 44100, nbytes=2, codec="pcm_s16le",
+                ffmpeg_params=["-ac", str(channels)] if channels else None,
+            )
+        finally:
+            video.close()
+
+def wav_to_video(video_path: str, wav_path: str, output_path: str, audio_bitrate: str = "192k") -> None:
+    """
+    Replaces the audio of a video with `wav_path`. With ffmpeg the video stream is copied untouched
+    (no re-encode, no quality loss) and only the new audio is encoded, AAC unless the container needs another codec.
+    moviepy, used if ffmpeg is missing or fails, re-encodes the video.
+    """
+    audio_codec = REMUX_AUDIO_CODECS.get(os.path.splitext(output_path)[1].lower(), "aac")
+    args = [
+        "-i", video_path, "-i", wav_path,
+        "-map", "0:v", "-map", "1:a:0",
+        "-c:v", "copy", "-c:a", audio_codec, "-b:a", audio_bitrate,
+        output_path,
+    ]
+    with span("media.remux"):
+        if _run_ffmpeg(args):
+            return
+        from moviepy import AudioFileClip, VideoFileClip
+        video = VideoFileClip(video_path)
+        audio = AudioFileClip(wav_path)
+        video_with_audio = video.with_audio(audio)
+        video_with_audio.write_videofile(output_path, audio=True)
+
+def to_serializable(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def write_json(data: Dict, output_dir: str, filename: str = "asr_result"):
     os.makedirs(output_dir, exist_ok=True)
     time = datetime.now() # TODO: strip
     filepath = os.path.join(output_dir, f"{filename}_{time}.json")
     with open(filepath, 'w') as f:
-        json.dump(data, f)
+        json.dump(data, f, default=to_serializable)
 
 def read_json(json_path: str):
     with open(json_path, 'r') as f:
         data = json.load(f)
         return data
 
-def save_wav(audio: List[np.float32], output_path: str, sample_rate: int = 24000) -> None:
-    waveform = torch.tensor(audio).unsqueeze(0)
+def file_hash(path: Union[str, List[str]], block_size: int = 1 << 20) -> str:
+    paths = [path] if isinstance(path, str) else sorted(path)
+    digest = hashlib.sha256()
+    for p in paths:
+        with open(p, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+def save_wav(audio: np.ndarray, output_path: str, sample_rate: int = 24000) -> None:
+    import torch
+    import torchaudio
+    waveform = torch.from_numpy(as_float32(audio)).unsqueeze(0)
     torchaudio.save(output_path, waveform, sample_rate=sample_rate)
 
-def stretch(audio: np.ndarray, sample_rate: int, target_duration: float):
-    current_duration = len(audio) / sample_rate
+def stretch(audio: np.ndarray, sample_rate: int, target_duration: float, method: str = "sox") -> np.ndarray:
+    audio = as_float32(audio)
+    current_duration = audio.shape[0] / sample_rate
     rate = current_duration / target_duration
-    stretched = torchaudio.sox_effects.apply_effects_tensor(
-    torch.Tensor(np.array([audio])), sample_rate, effects=[['tempo', str(rate)]]
+    with span(f"stretch.{method}", audio_s=current_duration):
+        if method == "wsola":
+            from src.timestretch import wsola
+            return wsola(audio, rate, sample_rate)
+        import torch
+        import torchaudio
+        stretched, _ = torchaudio.sox_effects.apply_effects_tensor(
+            torch.from_numpy(audio).unsqueeze(0), sample_rate, effects=[['tempo', str(rate)]]
         )
-    stretched = stretched[0].numpy()
-    return stretched
+        return stretched[0].numpy()
 
 def np_to_audiosegment(array: np.ndarray, sample_rate: int):
     # TODO: check transform to int16
@@ -113,7 +223,8 @@ def concat_chunks(chunks: List[AudioSegment], segments: List[List], len_orig_aud
             reconstructed += AudioSegment.silent(duration=(len_orig_audio - current_position))
     return reconstructed
 
-def cosine_similarity(vec1: torch.Tensor, vec2: torch.Tensor) -> float:
+def cosine_similarity(vec1: "torch.Tensor", vec2: "torch.Tensor") -> float:
+    import torch.nn.functional as F
     vec1_flat = vec1.view(-1)
     vec2_flat = vec2.view(-1)
 
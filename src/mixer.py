@@ -0,0 +1,159 @@
+import os
+import wave
+from typing import Dict
+
+import numpy as np
+from pydub import AudioSegment
+
+from src.audio import AudioStore, ms_to_samples, resample, to_audiosegment, to_pcm
+
+NORMALIZE_HEADROOM = 0.1 # dB, same as pydub.effects.normalize
+
+
+def db_to_gain(db: float) -> float:
+    return 10 ** (db / 20)
+
+def normalize(audio: np.ndarray, headroom: float = NORMALIZE_HEADROOM) -> np.ndarray:
+    peak = np.max(np.abs(audio)) if audio.size else 0.0
+    if peak > 0:
+        audio *= db_to_gain(-headroom) / peak
+    return audio
+
+def fade_out(audio: np.ndarray, sample_rate: int, duration_ms: float) -> np.ndarray:
+    n = min(len(audio), ms_to_samples(duration_ms, sample_rate))
+    if n > 0:
+        audio[-n:] *= 1 - np.arange(n, dtype=audio.dtype) / n # pydub's per-frame fade
+    return audio
+
+
+class Mixer:
+    """
+    Mixes synthesized speech into the original audio.
+
+    One float32 buffer of the original length is allocated once. Chunks are copied into it
+    (everything between chunks stays silent) and synthesized segments are added in place
+    at their sample offsets. Conversion to the output format happens once in `to_audiosegment`.
+
+    Args:
+        store (AudioStore): Decoded original audio.
+        orig_gain (float): Gain of the original audio under synthesized speech, dB.
+        synth_gain (float): Gain of the synthesized speech after normalization, dB.
+        fade_out (float): Fade out of the synthesized speech, ms.
+    """
+
+    def __init__(self, store: AudioStore, orig_gain: float = -3, synth_gain: float = 1, fade_out: float = 100):
+        self.store = store
+        self.sample_rate = store.sample_rate
+        self.orig_gain = db_to_gain(orig_gain)
+        self.synth_gain = db_to_gain(synth_gain)
+        self.fade_out = fade_out
+        self.buffer = None
+
+    def _chunk_bounds(self, chunk: Dict):
+        return (
+            ms_to_samples(chunk["orig_seg"]["start"], self.sample_rate),
+            ms_to_samples(chunk["orig_seg"]["end"], self.sample_rate),
+        )
+
+    def _chunk_buffer(self, chunk: Dict) -> np.ndarray:
+        if self.buffer is None:
+            self.buffer = np.zeros(self.store.samples.shape, dtype=np.float32)
+        start, end = self._chunk_bounds(chunk)
+        return self.buffer[start:end]
+
+    def add_chunk(self, chunk: Dict) -> None:
+        start, end = self._chunk_bounds(chunk)
+        self._chunk_buffer(chunk)[:] = self.store.samples[start:end]
+
+    def add_speech(self, chunk: Dict, start_ms: int, end_ms: int, synth: np.ndarray, sample_rate: int) -> None:
+        """
+        Lowers the original under [start_ms, end_ms) of the chunk and adds the synthesized speech there.
+
+        Args:
+            chunk (Dict): Chunk the speech belongs to, added with `add_chunk` before.
+            start_ms (int), end_ms (int): Speech boundary relative to the chunk start.
+            synth (np.ndarray): Synthesized mono float32 speech, modified in place.
+            sample_rate (int): Sample rate of `synth`.
+        """
+        chunk_start, _ = self._chunk_bounds(chunk)
+        buffer = self._chunk_buffer(chunk)
+        start = ms_to_samples(chunk["orig_seg"]["start"] + start_ms, self.sample_rate) - chunk_start
+        end = ms_to_samples(chunk["orig_seg"]["start"] + end_ms, self.sample_rate) - chunk_start
+        buffer[start:end] *= self.orig_gain
+
+        synth = normalize(fade_out(synth, sample_rate, self.fade_out)) # as `apply_fade_and_normalize`
+        synth = resample(synth, sample_rate, self.sample_rate)[:len(buffer[start:end])]
+        synth *= self.synth_gain
+        np.clip(synth, -1.0, 1.0, out=synth) # pydub clips the gained segment before overlay
+        buffer[start:start + len(synth)] += synth[:, None]
+
+    def to_audiosegment(self) -> AudioSegment:
+        buffer = self.buffer if self.buffer is not None else np.zeros(self.store.samples.shape, dtype=np.float32)
+        return to_audiosegment(buffer, self.sample_rate, self.store.sample_width)
+
+
+class StreamingMixer(Mixer):
+    """
+    Mixer that writes the result straight to a WAV file in timeline order.
+
+    Only the chunk being mixed is kept in memory: when the next chunk is added, the silence
+    up to it and the finished chunk are written in blocks. Chunks must be added in timeline order.
+
+    Args:
+        store (AudioStore): Decoded original audio.
+        output_path (str): Path of the output WAV file.
+        block_size (int): Frames of silence written at once.
+    """
+
+    def __init__(self, store: AudioStore, output_path: str, block_size: int = 1 << 16, **kwargs):
+        super().__init__(store, **kwargs)
+        self.output_path = output_path
+        self.block_size = block_size
+        self.position = 0
+        self._chunk = None
+        self._current = None
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        self._writer = wave.open(output_path, "wb")
+        self._writer.setnchannels(store.channels)
+        self._writer.setsampwidth(store.sample_width)
+        self._writer.setframerate(store.sample_rate)
+
+    def _chunk_buffer(self, chunk: Dict) -> np.ndarray:
+        if chunk is not self._chunk:
+            raise ValueError("StreamingMixer: speech must belong to the last added chunk.")
+        return self._current
+
+    def _write_silence(self, until: int) -> None:
+        while self.position < until:
+            n = min(self.block_size, until - self.position)
+            self._writer.writeframes(bytes(n * self.store.channels * self.store.sample_width))
+            self.position += n
+
+    def _flush(self) -> None:
+        if self._chunk is None:
+            return
+        start, end = self._chunk_bounds(self._chunk)
+        self._write_silence(start)
+        self._writer.writeframes(to_pcm(self._current, self.store.sample_width).tobytes())
+        self.position = end
+        self._chunk, self._current = None, None
+
+    def add_chunk(self, chunk: Dict) -> None:
+        self._flush()
+        start, end = self._chunk_bounds(chunk)
+        if start < self.position:
+            raise ValueError("StreamingMixer: chunks must be added in timeline order.")
+        self._chunk = chunk
+        self._current = np.array(self.store.samples[start:end], dtype=np.float32)
+
+    def close(self) -> str:
+        """
+        Writes the last chunk and the trailing silence, closes the file and returns its path.
+        """
+        self._flush()
+        self._write_silence(len(self.store.samples))
+        self._writer.close()
+        return self.output_path
+
+    def to_audiosegment(self) -> AudioSegment:
+        return AudioSegment.from_file(self.close())
@@ -1,21 +1,144 @@
-from typing import Dict, Union
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Union
 
-from transformers import MarianMTModel, MarianTokenizer
+from src.backends import converted_path, load_int8, load_onnx_seq2seq
+from src.cache import TranslationCache
+from src.helpers import split_sentences
+from src.profiling import span
 
 
 class MT:
     """
     A class for Machine Translation (MT) using the MarianMT model.
+    The model is loaded on first use, or with `load()`, so cached translations need no model.
     """
-    def __init__(self, model_name: str = "Helsinki-NLP/opus-mt-en-ru"):
+    def __init__(
+        self,
+        model_name: str = "Helsinki-NLP/opus-mt-en-ru",
+        batch_size: int = 16,
+        cache_path: Optional[str] = None,
+        cache_size: int = 100_000,
+        backend: str = "torch",
+        models_dir: Optional[str] = None,
+    ):
         """
         Initializes the MT class with a MarianMT model.
 
         Args:
             model_name (str): The name of the MarianMT model to use. Default is "Helsinki-NLP/opus-mt-en-ru".
+            batch_size (int): Number of sentences translated in one `generate` call.
+            cache_path (Optional[str]): SQLite translation memory. No cache if None.
+            cache_size (int): Max number of cached translations.
+            backend (str): "torch" (fp32), "int8" (dynamic int8 quantization of the linear layers)
+                or "onnx" (ONNX Runtime export via optimum).
+            models_dir (Optional[str]): Cache of the converted int8 and onnx models. Converted on every load if None.
         """
-        self.tokenizer = MarianTokenizer.from_pretrained(model_name)
-        self.model=MarianMTModel.from_pretrained(model_name)
+        if backend not in ("torch", "int8", "onnx"):
+            raise ValueError(f"Unknown MT backend: {backend}")
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache_path = cache_path
+        self.cache_size = cache_size
+        self.backend = backend
+        self.models_dir = models_dir
+        self._tokenizer, self._model, self._cache = None, None, None
+        self._load_lock = threading.Lock()
+
+    def load(self) -> "MT":
+        with self._load_lock:
+            if self._model is None:
+                from transformers import MarianMTModel, MarianTokenizer
+                self._tokenizer = MarianTokenizer.from_pretrained(self.model_name)
+                self._model = self._load_model(MarianMTModel)
+        return self
+
+    def _load_model(self, model_class):
+        if self.backend == "torch":
+            return model_class.from_pretrained(self.model_name)
+        import torch
+        import transformers
+        path = converted_path(self.models_dir, self.model_name, self.backend, torch.__version__, transformers.__version__)
+        if self.backend == "int8":
+            return load_int8(lambda: model_class.from_pretrained(self.model_name), path)
+        return load_onnx_seq2seq(self.model_name, path)
+
+    @property
+    def tokenizer(self):
+        return self.load()._tokenizer
+
+    @property
+    def model(self):
+        return self.load()._model
+
+    @property
+    def cache(self) -> Optional[TranslationCache]:
+        """
+        Translation memory, opened on first use. The namespace holds the generation config
+        the model loads with, read without loading the model.
+        """
+        if self.cache_path is None:
+            return None
+        with self._load_lock:
+            if self._cache is None:
+                from transformers import AutoConfig, GenerationConfig
+                try:
+                    generation_config = GenerationConfig.from_pretrained(self.model_name)
+                except OSError:
+                    generation_config = GenerationConfig.from_model_config(AutoConfig.from_pretrained(self.model_name))
+                namespace = f"{self.model_name}:{generation_config.to_json_string(use_diff=False)}"
+                if self.backend != "torch": # quantized and exported models may translate slightly differently
+                    namespace = f"{self.backend}:{namespace}"
+                self._cache = TranslationCache(self.cache_path, namespace, max_entries=self.cache_size)
+        return self._cache
+
+    def cache_stats(self) -> Optional[Dict]:
+        """
+        Stats of the translation memory, None if it was not used.
+        """
+        return self._cache.stats() if self._cache is not None else None
+
+    def _translate(self, sentences: List[str]) -> List[str]:
+        """
+        Translates sentences, looking them up in the translation memory first.
+        Every distinct missing sentence is generated once.
+        """
+        translations = [None] * len(sentences)
+        if self.cache is not None:
+            with span("mt.cache", sentences=len(sentences)) as record:
+                translations = self.cache.get_many(sentences)
+                record["counts"]["hits"] = sum(t is not None for t in translations)
+        missing = list(dict.fromkeys(s for s, t in zip(sentences, translations) if t is None))
+        if missing:
+            generated = self._generate(missing)
+            by_sentence = dict(zip(missing, generated))
+            translations = [by_sentence[s] if t is None else t for s, t in zip(sentences, translations)]
+            if self.cache is not None:
+                self.cache.put_many(missing, generated)
+        return translations
+
+    def _generate(self, sentences: List[str]) -> List[str]:
+        """
+        Translates sentences in padded batches. Sentences are sorted by token length
+        so that every batch holds sentences of similar length and padding stays small.
+        """
+        if not sentences:
+            return []
+        import torch
+        input_ids = self.tokenizer(sentences, truncation=True)["input_ids"]
+        order = sorted(range(len(sentences)), key=lambda i: len(input_ids[i]))
+        translations = [""] * len(sentences)
+        for b in range(0, len(order), self.batch_size):
+            batch_idx = order[b:b + self.batch_size]
+            inputs = self.tokenizer.pad({"input_ids": [input_ids[i] for i in batch_idx]}, return_tensors="pt")
+            with span("mt.generate", sentences=len(batch_idx)) as record, torch.inference_mode():
+                outputs = self.model.generate(**inputs)
+                record["counts"]["input_tokens"] = int(inputs["attention_mask"].sum())
+                record["counts"]["output_tokens"] = int((outputs != self.tokenizer.pad_token_id).sum())
+            decoded = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+            for i, translated_text in zip(batch_idx, decoded):
+                translations[i] = translated_text
+        return translations
 
     def translate(self, text: Union[str, Dict]) -> Union[str, Dict]:
         """
@@ -26,26 +149,28 @@ class MT:
             Union[str, Dict]: The translated text (if dict, the keys are the same as the input dict).
         """
         if isinstance(text, str):
-            inputs = self.tokenizer.encode(text, return_tensors="pt", padding=True)
-            outputs = self.model.generate(inputs)
-            translated_text = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)[0]
-            return translated_text
-        
+            return self._translate([text])[0]
+
         elif isinstance(text, dict):
-            for chunk in text.values():
+            sentences, owners = [], []
+            for key, chunk in text.items():
                 if not chunk["asr_result"]:
-                    chunk["translated_text"] = ""
                     continue
-                chunk_text = ""
-                for seg in chunk["asr_result"]:
-                    temp = " ".join([s["text"].strip() for s in seg])
-                    chunk_text += " " + temp
-
-                inputs = self.tokenizer.encode(chunk_text, return_tensors="pt", padding=True)
-                outputs = self.model.generate(inputs)
-                translated_text = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)[0]
-                chunk["translated_text"] = translated_text
-            
+                chunk_text = " ".join([s["text"].strip() for seg in chunk["asr_result"] for s in seg])
+                for sentence in split_sentences(chunk_text):
+                    sentences.append(sentence)
+                    owners.append(key)
+
+            audio_s = sum(chunk["len"] for chunk in text.values())
+            characters = sum(len(s) for s in sentences)
+            with span("mt.translate", chunk=list(text), audio_s=audio_s, sentences=len(sentences), characters=characters):
+                translations = self._translate(sentences)
+            translated = defaultdict(list)
+            for key, translated_text in zip(owners, translations):
+                translated[key].append(translated_text)
+            for key, chunk in text.items():
+                chunk["translated_text"] = " ".join(translated[key])
+
             return text
         else:
             raise ValueError("Machine Translation: Input must be a string or a dictionary")
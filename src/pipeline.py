@@ -1,74 +1,444 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 from config import config
 from pydub import AudioSegment
 
+from src.artifacts import ArtifactStore, stage_key
 from src.asr import ASR
-from src.helpers import (
-    apply_fade_and_normalize,
-    concat_chunks,
-    np_to_audiosegment,
-    overlay_on_chunk,
-    stretch,
-)
+from src.audio import AudioStore, as_float32
+from src.helpers import file_hash, stretch
+from src.mixer import Mixer, StreamingMixer
 from src.mt import MT
+from src.profiling import Profiler, active_profiler, span
+from src.segments import SegmentTable
+from src.streaming import run_stages
 from src.tts import XTTSv2
 from src.utils import get_chunks, update_boundary
+from src.vad import VAD
+
+TTS_MODEL_FIELDS = {"workers", "torch_threads"} # set up the model, not a single synthesis call
+STRETCH_BINS = [0, 0.95, 1.05, 1.25, 1.5, 2, np.inf] # stretch rate histogram of the fit report
 
 
 class VideoDubPipe:
-    def __init__(self, config_path: str):
+    """
+    Dubbing pipeline. Models are loaded on first use, so a run that restores a stage from artifacts
+    never loads its model. `warmup()` (or `pipeline.warmup` in the config) loads them in parallel upfront.
+    Already created models can be passed in to share them between pipelines.
+    """
+
+    def __init__(
+        self,
+        config_path: str,
+        asr_model: Optional[ASR] = None,
+        mt_model: Optional[MT] = None,
+        tts_model: Optional[XTTSv2] = None,
+        vad: Optional[VAD] = None,
+    ):
+        self._created = time.perf_counter()
+        self.time_to_first_stage = None
+        self.profiler = None
         print("Init config...")
         self.cfg = config.load_config(config_path)
         self.speaker_path = self.cfg["reference_wav"]
         self.sample_rate=self.cfg["sample_rate"]
-        self.pp_pause = self.cfg["postprocess"]["pause"]
-        self.pp_fade = self.cfg["postprocess"]["fade_out"]
-        self.pp_orig_gain = self.cfg["postprocess"]["orig_gain"]
-        self.pp_synth_gain = self.cfg["postprocess"]["synth_gain"]
-
-        print("Init ASR...")
-        self.asr_model = ASR(model_type=self.cfg["asr"]["model_type"], device=self.cfg["device"])
-        print("Init MT...")
-        self.mt_model = MT(model_name=self.cfg["mt"]["model_name"])
-        print("Init TTS...")
-        self.tts_model = XTTSv2(device=self.cfg["device"])
-        self.tts_config = dict(self.cfg["tts"])
-        print("Initialization completed.")
+        self._set_job_config(self.cfg["tts"], self.cfg["postprocess"])
+
+        self.vad = vad or VAD()
+        self.asr_model = asr_model or ASR(
+            model_type=self.cfg["asr"]["model_type"],
+            device=self.cfg["device"],
+            batch_size=self.cfg["asr"]["batch_size"],
+            backend=self.cfg["asr"]["backend"],
+            models_dir=self._cache_path("models"),
+        )
+        self.mt_model = mt_model or MT(
+            model_name=self.cfg["mt"]["model_name"],
+            batch_size=self.cfg["mt"]["batch_size"],
+            cache_path=self._cache_path("mt.sqlite"),
+            cache_size=self.cfg["cache"]["mt_max_entries"],
+            backend=self.cfg["mt"]["backend"],
+            models_dir=self._cache_path("models"),
+        )
+        self.tts_model = tts_model or XTTSv2(
+            device=self.cfg["device"],
+            latents_dir=self._cache_path("latents"),
+            audio_cache_dir=self._cache_path("tts"),
+            audio_cache_mb=self.cfg["cache"]["tts_max_mb"],
+            workers=self.cfg["tts"]["workers"],
+            worker_threads=self.cfg["tts"]["torch_threads"],
+        )
+        self.start_fit_report()
+        if self.cfg["pipeline"]["warmup"]:
+            self.warmup()
+        print(f"Initialization completed in {time.perf_counter() - self._created:.2f} s.")
+
+    def warmup(self, stages: Sequence[str] = ("vad", "asr", "mt", "tts")) -> Dict[str, float]:
+        """
+        Loads the models of `stages` in parallel threads.
+
+        Returns:
+            Dict[str, float]: load time of every model, s.
+        """
+        models = {"vad": self.vad, "asr": self.asr_model, "mt": self.mt_model, "tts": self.tts_model}
+
+        def load(stage: str) -> float:
+            start = time.perf_counter()
+            models[stage].load()
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=max(1, len(stages))) as pool:
+            load_times = dict(zip(stages, pool.map(load, stages)))
+        print("Warm-up: " + ", ".join(f"{stage} {t:.2f} s" for stage, t in load_times.items()))
+        return load_times
+
+    def _set_job_config(self, tts: config.TTSConfig, postprocess: config.PostProcess) -> None:
+        self.cfg.tts, self.cfg.postprocess = tts, postprocess
+        self.tts_config = tts.model_dump(exclude=TTS_MODEL_FIELDS)
+        self.pp_pause = postprocess["pause"]
+        self.pp_fade = postprocess["fade_out"]
+        self.pp_orig_gain = postprocess["orig_gain"]
+        self.pp_synth_gain = postprocess["synth_gain"]
+        self.pp_stretch_method = postprocess["stretch_method"]
+
+    @contextmanager
+    def overrides(self, tts: Optional[Dict] = None, postprocess: Optional[Dict] = None):
+        """
+        Overrides fields of the `tts` and `postprocess` config sections inside the block, e.g. for one job
+        of a long-running worker. Fields that set up the TTS model can not be overridden.
+        """
+        tts, postprocess = tts or {}, postprocess or {}
+        sections = {"tts": (tts, config.TTSConfig), "postprocess": (postprocess, config.PostProcess)}
+        for section, (fields, model) in sections.items():
+            unknown = set(fields) - set(model.model_fields)
+            if unknown:
+                raise ValueError(f"Unknown {section} fields: {sorted(unknown)}")
+        if set(tts) & TTS_MODEL_FIELDS:
+            raise ValueError(f"TTS fields {sorted(TTS_MODEL_FIELDS)} can not be overridden per job")
+
+        base_tts, base_postprocess = self.cfg["tts"], self.cfg["postprocess"]
+        self._set_job_config(
+            config.TTSConfig(**{**base_tts.model_dump(), **tts}),
+            config.PostProcess(**{**base_postprocess.model_dump(), **postprocess}),
+        )
+        try:
+            yield self
+        finally:
+            self._set_job_config(base_tts, base_postprocess)
+
+    @contextmanager
+    def _profile(self, path_to_wav: str):
+        """
+        Profiles the run into `pipeline.profile_dir`: a JSON summary with all spans and a Chrome trace.
+        Yields the record of the whole run. Runs inside an already active profiler are recorded there.
+        """
+        profile_dir = self.cfg["pipeline"]["profile_dir"]
+        if profile_dir is None or active_profiler() is not None:
+            with span("pipeline.transform") as record:
+                yield record
+            return
+        self.profiler = Profiler()
+        with self.profiler.activate(), span("pipeline.transform") as record:
+            yield record
+        name = os.path.splitext(os.path.basename(path_to_wav))[0]
+        print("Profile:")
+        self.profiler.print_summary()
+        self.profiler.to_json(os.path.join(profile_dir, f"{name}.profile.json"))
+        self.profiler.to_chrome_trace(os.path.join(profile_dir, f"{name}.trace.json"))
+
+    def _first_stage(self) -> None:
+        if self.time_to_first_stage is None:
+            self.time_to_first_stage = time.perf_counter() - self._created
+            print(f"Time to first stage: {self.time_to_first_stage:.2f} s")
         
-    def transform(self, path_to_wav: str,  output_dir: str): # TODO: refactor params
-        print("Split on chunks...")
-        chunks, orig_segments, len_orig_audio = get_chunks(path_to_wav, output_dir)
-        print("Transcribe...")
-        chunks = self.asr_model.transcribe(chunks, save=self.cfg["asr"]["save_results"])
-        print("Translate...")
-        chunks = self.mt_model.translate(chunks)
-        print("TTS step...")
-        tts_chunks = self.tts_model.tts_chunks(chunks, self.speaker_path, **self.tts_config)
-        durations = [len(ch) for ch in tts_chunks]
-        durations = [round(x/self.sample_rate,2) for x in durations]
-        new_sp_boundary = update_boundary(chunks, durations, pause=self.pp_pause) # подгон сегментов с учетом пауз
-        result_chunks = []
-        print("Combine...")
-        for chunk, tts_sample, sp_seg in zip(chunks.values(), tts_chunks, new_sp_boundary):
-            original_wav = AudioSegment.from_file(chunk["path"])
-            if not sp_seg:
-                result_chunks.append(original_wav)
-                continue
-            duration = np.round(sp_seg["end"], 3) - np.round(sp_seg["start"], 3)
-            synth_np_stretched = stretch(np.array(tts_sample), self.sample_rate, duration)
-
-            synth_audioseg = np_to_audiosegment(synth_np_stretched, self.sample_rate)
-            synth_audioseg = apply_fade_and_normalize(synth_audioseg, fade_out_ms=self.pp_fade)
-
-            start_ms = int(sp_seg["start"] * 1000)
-            end_ms = int(sp_seg["end"] * 1000)
-
-            processed_chunk = overlay_on_chunk(
-                original_wav, start_ms, end_ms, synth_audioseg,
-                gain_original=self.pp_orig_gain, gain_synth=self.pp_synth_gain
+    def _cache_path(self, name: str) -> Optional[str]:
+        cache_dir = self.cfg["cache"]["dir"]
+        return os.path.join(cache_dir, name) if cache_dir else None
+
+    def _artifacts(self, output_dir: str) -> ArtifactStore:
+        return ArtifactStore(self._cache_path("artifacts") or os.path.join(output_dir, "artifacts"))
+
+    def _run_stage(
+        self, artifacts: ArtifactStore, stage: str, key: str, chunks: Dict, fn: Callable[[Dict], Dict]
+    ) -> Dict:
+        """
+        Runs `fn` on the chunks that have no stored result yet, in groups of `cache.checkpoint_every`
+        chunks, and stores every result as soon as its group is finished.
+
+        Returns:
+            Dict: stage result for every chunk id.
+        """
+        results = artifacts.load_chunks(stage, key) if self.cfg["cache"]["resume"] else {}
+        pending = [i for i in chunks if i not in results]
+        if results:
+            print(f"{stage}: {len(results)}/{len(chunks)} chunks restored")
+        every = self.cfg["cache"]["checkpoint_every"]
+        for b in range(0, len(pending), every):
+            group_results = fn({i: chunks[i] for i in pending[b:b + every]})
+            for i, value in group_results.items():
+                artifacts.save_chunk(stage, key, i, value)
+            results.update(group_results)
+        artifacts.mark_done(stage, key)
+        return results
+
+    def _restore_chunks(self, artifacts: ArtifactStore, key: str) -> Optional[Tuple[Dict, List, int]]:
+        """
+        Chunks, original segments and audio length stored by a finished chunk stage, None if there are none.
+        """
+        if not artifacts.is_done("chunks", key):
+            return None
+        table_path = os.path.join(artifacts.stage_dir("chunks", key), "segments.npz")
+        if os.path.exists(table_path):
+            table = SegmentTable.load(table_path)
+            chunks = table.to_chunks()
+            orig_segments = [[c["orig_seg"]["start"], c["orig_seg"]["end"]] for c in chunks.values()]
+            return chunks, orig_segments, table.len_audio_ms
+        result = artifacts.load("chunks", key, "result") # written before the segment table
+        if result is None:
+            return None
+        chunks = {int(i): chunk for i, chunk in result["chunks"].items()}
+        return chunks, result["orig_segments"], result["len_orig_audio"]
+
+    def _chunk_stage(self, artifacts: ArtifactStore, key: str, store: AudioStore, output_dir: str):
+        table_path = os.path.join(artifacts.stage_dir("chunks", key), "segments.npz")
+        restored = self._restore_chunks(artifacts, key) if self.cfg["cache"]["resume"] else None
+        if restored is not None:
+            print("chunks: restored")
+            return restored
+
+        chunks, orig_segments, len_orig_audio = get_chunks(
+            store,
+            output_dir,
+            min_silence_len=self.cfg["chunks"]["min_silence_len"],
+            silence_thresh=self.cfg["chunks"]["silence_thresh"],
+            export_wavs=self.cfg["chunks"]["export_wavs"],
+            vad=self.vad,
+        )
+        SegmentTable.from_chunks(chunks, len_orig_audio).save(table_path)
+        artifacts.mark_done("chunks", key)
+        return chunks, orig_segments, len_orig_audio
+
+    def _stage_keys(self, path_to_wav: str) -> Dict[str, str]:
+        chunks_key = stage_key(file_hash(path_to_wav), self.cfg["chunks"].model_dump(exclude={"export_wavs"}))
+        asr_key = stage_key(chunks_key, self.cfg["asr"].model_dump(exclude={"save_results"}))
+        mt_key = stage_key(asr_key, self.cfg["mt"].model_dump())
+        tts_key = stage_key(
+            mt_key, self.tts_config, self.tts_model.model_id, self.tts_model.speaker_hash(self.speaker_path)
+        )
+        return {"chunks": chunks_key, "asr": asr_key, "mt": mt_key, "tts": tts_key}
+
+    def _transcribe(self, group: Dict, store: Union[AudioStore, Dict]) -> Dict:
+        group = self.asr_model.transcribe(group, store, save=self.cfg["asr"]["save_results"])
+        return {i: chunk["asr_result"] for i, chunk in group.items()}
+
+    def _translate(self, group: Dict) -> Dict:
+        return {i: chunk["translated_text"] for i, chunk in self.mt_model.translate(group).items()}
+
+    def _synthesize(self, group: Dict) -> Dict:
+        audio = self.tts_model.tts_chunks(group, self.speaker_path, **self.tts_config)
+        return {i: as_float32(a) for i, a in zip(group, audio)}
+
+    def start_fit_report(self) -> None:
+        """
+        Starts counting the synthesized and placed speech for `fit_report`.
+        """
+        self._fit_rates, self._received_s, self._placed_s = [], 0.0, 0.0
+        self._tts_cut = self.tts_model.sample_counts["cut"]
+
+    def fit_report(self) -> Dict:
+        """
+        How well the synthesized speech fitted the chunks since `start_fit_report`: the share of
+        synthesized samples cut off or squeezed out by stretching, and the distribution of
+        stretch rates (synthesized / placed duration, over 1 for compressed speech).
+        """
+        cut_s = (self.tts_model.sample_counts["cut"] - self._tts_cut) / self.sample_rate
+        generated_s = self._received_s + cut_s # restored chunks count as synthesized without cut
+        rates = np.array(self._fit_rates)
+        report = {
+            "generated_s": round(generated_s, 3),
+            "cut_s": round(cut_s, 3),
+            "placed_s": round(float(self._placed_s), 3),
+            "wasted_ratio": round(float(1 - self._placed_s / generated_s), 4) if generated_s else 0.0,
+            "chunks": len(rates),
+        }
+        if len(rates):
+            p50, p90 = np.percentile(rates, [50, 90])
+            counts, _ = np.histogram(rates, bins=STRETCH_BINS)
+            report["stretch_rate"] = {
+                "p50": round(float(p50), 3),
+                "p90": round(float(p90), 3),
+                "max": round(float(rates.max()), 3),
+                "stretched_share": round(float(np.mean(rates > 1.05)), 4),
+                "histogram": {f"{a:g}-{b:g}": int(c) for a, b, c in zip(STRETCH_BINS[:-1], STRETCH_BINS[1:], counts)},
+            }
+        return report
+
+    def _print_fit_report(self) -> None:
+        report = self.fit_report()
+        line = f"TTS fit: {report['wasted_ratio']:.1%} of {report['generated_s']:.1f} s synthesized wasted"
+        if "stretch_rate" in report:
+            rate = report["stretch_rate"]
+            line += (
+                f", stretch rate p50 {rate['p50']:.2f}, p90 {rate['p90']:.2f}, max {rate['max']:.2f}, "
+                f"{rate['stretched_share']:.0%} of chunks stretched"
+            )
+        print(line)
+
+    def _mix_chunk(
+        self, mixer: Mixer, chunk_id: int, chunk: Dict, tts_sample: np.ndarray, fit: Optional[Dict] = None
+    ) -> None:
+        with span("mix.chunk", chunk=chunk_id, audio_s=chunk["len"]):
+            self._add_to_mix(mixer, chunk, tts_sample, fit)
+
+    def _fit_all(self, chunks: Dict, tts_results: Dict) -> List[Dict]:
+        """
+        Speech placement of all chunks at once, as `update_boundary` would place each.
+        """
+        durations = [round(as_float32(tts_results[i]).shape[0] / self.sample_rate, 2) for i in chunks]
+        return SegmentTable.from_chunks(chunks).fit_boundaries(durations)
+
+    def _add_to_mix(self, mixer: Mixer, chunk: Dict, tts_sample: np.ndarray, fit: Optional[Dict] = None) -> None:
+        mixer.add_chunk(chunk)
+        tts_sample = as_float32(tts_sample)
+        self._received_s += tts_sample.shape[0] / self.sample_rate
+        if fit is None:
+            duration = round(tts_sample.shape[0] / self.sample_rate, 2)
+            fit = update_boundary({0: chunk}, [duration], pause=self.pp_pause)[0] # подгон сегментов с учетом пауз
+        if not fit:
+            return
+        duration = np.round(fit["end"], 3) - np.round(fit["start"], 3)
+        if duration <= 0: # no synthesized speech for the chunk
+            return
+        self._fit_rates.append(tts_sample.shape[0] / self.sample_rate / duration)
+        self._placed_s += duration
+        synth_np_stretched = stretch(
+            tts_sample, self.sample_rate, duration, method=self.pp_stretch_method
+        )
+
+        start_ms = int(fit["start"] * 1000)
+        end_ms = int(fit["end"] * 1000)
+        mixer.add_speech(chunk, start_ms, end_ms, synth_np_stretched, self.sample_rate)
+
+    def _mixer(self, store: AudioStore, output_path: Optional[str] = None) -> Mixer:
+        kwargs = dict(orig_gain=self.pp_orig_gain, synth_gain=self.pp_synth_gain, fade_out=self.pp_fade)
+        if output_path is not None:
+            return StreamingMixer(store, output_path, **kwargs)
+        return Mixer(store, **kwargs)
+
+    def _finish(self, store: AudioStore, mixer: Mixer, output_path: Optional[str]) -> Union[AudioSegment, str]:
+        result = mixer.close() if output_path is not None else mixer.to_audiosegment()
+        store.close()
+        return result
+
+    def _load_audio(self, path_to_wav: str) -> AudioStore:
+        return AudioStore(path_to_wav, mmap_dir=self.cfg["pipeline"]["mmap_dir"])
+
+    def transform(
+        self, path_to_wav: str, output_dir: str, output_path: Optional[str] = None
+    ) -> Union[AudioSegment, str]: # TODO: refactor params
+        """
+        Dubs the audio file. Returns the result as an AudioSegment, or, if `output_path` is given,
+        writes it to that WAV file chunk by chunk and returns the path.
+        """
+        if self.cfg["pipeline"]["streaming"]:
+            return self.transform_streaming(path_to_wav, output_dir, output_path)
+        with self._profile(path_to_wav) as profile:
+            print("Load audio...")
+            store = self._load_audio(path_to_wav)
+            profile["audio_s"] = store.len_ms / 1000
+            artifacts = self._artifacts(output_dir)
+            keys = self._stage_keys(path_to_wav)
+            self.start_fit_report()
+
+            print("Split on chunks...")
+            self._first_stage()
+            chunks, orig_segments, len_orig_audio = self._chunk_stage(artifacts, keys["chunks"], store, output_dir)
+            print("Transcribe...")
+            asr_results = self._run_stage(
+                artifacts, "asr", keys["asr"], chunks, lambda group: self._transcribe(group, store)
             )
-            result_chunks.append(processed_chunk)
+            for i, chunk in chunks.items():
+                chunk["asr_result"] = asr_results[i]
+            print("Translate...")
+            mt_results = self._run_stage(artifacts, "mt", keys["mt"], chunks, self._translate)
+            for i, chunk in chunks.items():
+                chunk["translated_text"] = mt_results[i]
+            if self.mt_model.cache_stats() is not None:
+                print(f"MT cache: {self.mt_model.cache_stats()}")
+            print("TTS step...")
+            tts_results = self._run_stage(artifacts, "tts", keys["tts"], chunks, self._synthesize)
+            if self.tts_model.audio_cache is not None:
+                print(f"TTS cache: {self.tts_model.audio_cache.stats()}")
+            print("Combine...")
+            mixer = self._mixer(store, output_path)
+            fits = self._fit_all(chunks, tts_results)
+            for (i, chunk), fit in zip(chunks.items(), fits):
+                self._mix_chunk(mixer, i, chunk, tts_results.pop(i), fit)
+            self._print_fit_report()
+            return self._finish(store, mixer, output_path)
+
+    def transform_streaming(
+        self, path_to_wav: str, output_dir: str, output_path: Optional[str] = None
+    ) -> Union[AudioSegment, str]:
+        """
+        Streams chunks through ASR, MT, TTS and mixing, every stage in its own worker thread
+        connected by bounded queues (`pipeline.queue_size`), so e.g. ASR of chunk n+1 overlaps TTS of chunk n.
+        Per-chunk results are stored in and restored from the same artifacts as in `transform`.
+        With `output_path` memory stays bounded by the queue depth, not by the input length.
+        """
+        with self._profile(path_to_wav) as profile:
+            print("Load audio...")
+            store = self._load_audio(path_to_wav)
+            profile["audio_s"] = store.len_ms / 1000
+            artifacts = self._artifacts(output_dir)
+            keys = self._stage_keys(path_to_wav)
+            self.start_fit_report()
+            resume = self.cfg["cache"]["resume"]
+            print("Split on chunks...")
+            self._first_stage()
+            chunks, orig_segments, len_orig_audio = get_chunks(
+                store,
+                output_dir,
+                min_silence_len=self.cfg["chunks"]["min_silence_len"],
+                silence_thresh=self.cfg["chunks"]["silence_thresh"],
+                save=False,
+                export_wavs=self.cfg["chunks"]["export_wavs"],
+                vad=self.vad,
+            )
+
+            def cached(stage: str, field: str, fn: Callable[[Dict], Dict]):
+                def run(item):
+                    i, chunk = item
+                    value = artifacts.load(stage, keys[stage], f"chunk_{i}") if resume else None
+                    if value is None:
+                        value = fn({i: chunk})[i]
+                        artifacts.save_chunk(stage, keys[stage], i, value)
+                    chunk[field] = value
+                    return i, chunk
+                return run
+
+            mixer = self._mixer(store, output_path)
+
+            def mix(item):
+                i, chunk = item
+                self._mix_chunk(mixer, i, chunk, chunk.pop("tts_audio"))
+                return i
 
-        final_audio = concat_chunks(result_chunks, orig_segments, len_orig_audio)
-        return final_audio
+            print("Dubbing chunks...")
+            stages = [
+                cached("asr", "asr_result", lambda group: self._transcribe(group, store)),
+                cached("mt", "translated_text", self._translate),
+                cached("tts", "tts_audio", self._synthesize),
+                mix,
+            ]
+            for _ in run_stages(chunks.items(), stages, queue_size=self.cfg["pipeline"]["queue_size"]):
+                pass
+            for stage in ("asr", "mt", "tts"):
+                artifacts.mark_done(stage, keys[stage])
+            self._print_fit_report()
+            return self._finish(store, mixer, output_path)
@@ -0,0 +1,154 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+_active: Optional["Profiler"] = None
+
+
+def active_profiler() -> Optional["Profiler"]:
+    return _active
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident set size of the process so far, MB.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024 # bytes on macOS, KB on Linux
+
+@contextmanager
+def span(name: str, chunk=None, audio_s: Optional[float] = None, **counts):
+    """
+    Records a span in the active profiler, does nothing (but yield a record) if there is none.
+
+    The yielded record can be filled inside the block: `record["audio_s"]` for the real-time factor
+    and `record["counts"]` for item counts such as segments, tokens or characters.
+
+    Args:
+        name (str): Span name, "<stage>.<step>".
+        chunk: Chunk id (or list of ids) the span works on.
+        audio_s (Optional[float]): Duration of the audio processed or produced, s.
+        **counts: Item counts.
+    """
+    record = {"name": name, "chunk": chunk, "audio_s": audio_s, "counts": dict(counts)}
+    profiler = _active
+    if profiler is None:
+        yield record
+        return
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        profiler.add(record, start, time.perf_counter())
+
+
+class Profiler:
+    """
+    Collects spans with wall time, real-time factor (wall time / audio duration), peak RSS and item counts
+    and exports them as JSON or as Chrome trace events (chrome://tracing, Perfetto).
+
+    Components record spans with `span()`; they go to the profiler activated with `activate()`,
+    from any thread.
+    """
+
+    def __init__(self):
+        self.spans: List[Dict] = []
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self._threads: Dict[int, str] = {}
+
+    @contextmanager
+    def activate(self):
+        global _active
+        previous, _active = _active, self
+        try:
+            yield self
+        finally:
+            _active = previous
+
+    def add(self, record: Dict, start: float, end: float) -> None:
+        thread = threading.current_thread()
+        duration = end - start
+        record.update(
+            start=start - self._t0,
+            duration=duration,
+            rtf=duration / record["audio_s"] if record["audio_s"] else None,
+            peak_rss_mb=peak_rss_mb(),
+            tid=thread.ident,
+        )
+        with self._lock:
+            self._threads[thread.ident] = thread.name
+            self.spans.append(record)
+
+    def summary(self) -> Dict[str, Dict]:
+        """
+        Totals per span name: calls, wall time, audio duration, real-time factor, peak RSS and counts.
+        """
+        totals = defaultdict(lambda: {
+            "calls": 0, "wall_s": 0.0, "audio_s": 0.0, "peak_rss_mb": None, "counts": defaultdict(int)
+        })
+        for record in self.spans:
+            total = totals[record["name"]]
+            total["calls"] += 1
+            total["wall_s"] += record["duration"]
+            total["audio_s"] += record["audio_s"] or 0.0
+            if record["peak_rss_mb"] is not None:
+                total["peak_rss_mb"] = max(total["peak_rss_mb"] or 0.0, record["peak_rss_mb"])
+            for key, value in record["counts"].items():
+                total["counts"][key] += value
+        for total in totals.values():
+            total["rtf"] = total["wall_s"] / total["audio_s"] if total["audio_s"] else None
+            total["counts"] = dict(total["counts"])
+        return dict(totals)
+
+    def print_summary(self) -> None:
+        for name, total in sorted(self.summary().items(), key=lambda item: -item[1]["wall_s"]):
+            rtf = f"{total['rtf']:.3f}" if total["rtf"] is not None else "-"
+            counts = ", ".join(f"{k}={v}" for k, v in total["counts"].items())
+            print(f"{name:24s} {total['calls']:5d} calls {total['wall_s']:9.3f} s  RTF {rtf:>7s}  {counts}")
+
+    def to_json(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"summary": self.summary(), "spans": self.spans}, f, indent=2, default=str)
+
+    def to_chrome_trace(self, path: str) -> None:
+        """
+        Writes spans as Chrome trace "complete" events, one track per thread.
+        """
+        pid = os.getpid()
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in self._threads.items()
+        ]
+        for record in self.spans:
+            events.append({
+                "name": record["name"] if record["chunk"] is None else f"{record['name']} [{record['chunk']}]",
+                "cat": record["name"].split(".")[0],
+                "ph": "X",
+                "ts": record["start"] * 1e6,
+                "dur": record["duration"] * 1e6,
+                "pid": pid,
+                "tid": record["tid"],
+                "args": {
+                    "chunk": record["chunk"],
+                    "audio_s": record["audio_s"],
+                    "rtf": record["rtf"],
+                    "peak_rss_mb": record["peak_rss_mb"],
+                    **record["counts"],
+                },
+            })
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
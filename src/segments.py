@@ -0,0 +1,261 @@
+"""
+Columnar segment table: the chunks of a run as NumPy structured arrays instead of nested dicts.
+
+All boundaries are in samples at `SAMPLE_RATE` (the VAD and ASR rate), absolute in the input.
+ASR timestamps stay in seconds relative to their speech piece, as Whisper returns them.
+"""
+import json
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+SAMPLES_PER_MS = SAMPLE_RATE // 1000
+
+CHUNK_DTYPE = np.dtype([("id", np.int64), ("start", np.int64), ("end", np.int64)])
+SPEECH_DTYPE = np.dtype([("chunk", np.int64), ("start", np.int64), ("end", np.int64)])
+ASR_DTYPE = np.dtype([("chunk", np.int64), ("group", np.int64), ("start", np.float64), ("end", np.float64)])
+FIELDS = ("speech_boundary", "asr_result", "translated_text")
+
+
+def _object_column(values: Sequence) -> np.ndarray:
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+def _pack_strings(values: Sequence[Optional[str]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Strings as one UTF-8 buffer, offsets and a None mask, so npz files need no pickling.
+    """
+    encoded = [(v or "").encode("utf-8") for v in values]
+    offsets = np.cumsum([0] + [len(e) for e in encoded], dtype=np.int64)
+    missing = np.array([v is None for v in values], dtype=bool)
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets, missing
+
+def _unpack_strings(buffer: np.ndarray, offsets: np.ndarray, missing: np.ndarray) -> np.ndarray:
+    data = buffer.tobytes()
+    bounds = zip(offsets[:-1].tolist(), offsets[1:].tolist(), missing.tolist())
+    return _object_column([None if none else data[start:end].decode("utf-8") for start, end, none in bounds])
+
+def round_seconds(samples: np.ndarray, sample_rate: int, digits: int = 2) -> np.ndarray:
+    """
+    `round(samples / sample_rate, digits)` for every element, vectorized. Exact halves are rounded
+    like Python's `round` does (by the binary value of the quotient), which `np.round` does not.
+    """
+    samples = np.asarray(samples, dtype=np.int64)
+    seconds = samples / sample_rate
+    rounded = np.round(seconds, digits)
+    ties = samples * (2 * 10 ** digits) % (2 * sample_rate) == sample_rate
+    rounded[ties] = [round(value, digits) for value in seconds[ties].tolist()]
+    return rounded
+
+def fit_boundaries(
+    speech_start: np.ndarray, speech_end: np.ndarray, lengths: np.ndarray, durations: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Places synthesized speech of `durations` seconds in the speech slots of the chunks, all chunks at once.
+
+    Speech that fits its slot keeps its duration and is centered on the slot, shifted to stay
+    inside the chunk of `lengths` seconds. Longer speech is squeezed into the slot.
+
+    Args:
+        speech_start, speech_end (np.ndarray): Slot bounds in the chunk, s.
+        lengths (np.ndarray): Chunk lengths, s.
+        durations (np.ndarray): Synthesized speech durations, s.
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: start and end of the speech in the chunk, s.
+    """
+    durations = np.asarray(durations, dtype=np.float64)
+    start = (speech_end + speech_start) / 2 - durations / 2
+    start = np.where(start < 0, 0.0, start)
+    end = start + durations
+    over = end > lengths
+    end = np.where(over, lengths, end)
+    start = np.where(over, end - durations, start)
+    fits = durations - (speech_end - speech_start) <= 0
+    return np.where(fits, start, speech_start), np.where(fits, end, speech_end)
+
+
+class SegmentTable:
+    """
+    Chunks, their VAD speech pieces, ASR segments and translations as columns.
+
+    Columns:
+        chunks: `CHUNK_DTYPE` rows, chunk id and bounds in the input.
+        speech: `SPEECH_DTYPE` rows sorted by chunk, `chunk` is the row of the chunk in `chunks`.
+        asr: `ASR_DTYPE` rows, `group` is the position in the chunk's `asr_result` list; `asr_text` is their text.
+        translation: translated text of every chunk.
+        paths: exported chunk WAV of every chunk (debug output), None if not exported.
+
+    Args:
+        fields: Which of `FIELDS` the chunks have, e.g. no `asr_result` before ASR.
+    """
+
+    __slots__ = ("chunks", "speech", "asr", "asr_text", "translation", "paths", "fields", "len_audio_ms")
+
+    def __init__(
+        self,
+        chunks: np.ndarray,
+        speech: Optional[np.ndarray] = None,
+        asr: Optional[np.ndarray] = None,
+        asr_text: Optional[np.ndarray] = None,
+        translation: Optional[np.ndarray] = None,
+        paths: Optional[np.ndarray] = None,
+        fields: Sequence[str] = (),
+        len_audio_ms: Optional[int] = None,
+    ):
+        n = len(chunks)
+        self.chunks = chunks
+        self.speech = speech if speech is not None else np.empty(0, dtype=SPEECH_DTYPE)
+        self.asr = asr if asr is not None else np.empty(0, dtype=ASR_DTYPE)
+        self.asr_text = asr_text if asr_text is not None else np.empty(0, dtype=object)
+        self.translation = translation if translation is not None else np.full(n, None, dtype=object)
+        self.paths = paths if paths is not None else np.full(n, None, dtype=object)
+        self.fields = tuple(f for f in FIELDS if f in fields)
+        self.len_audio_ms = len_audio_ms
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    @classmethod
+    def from_chunks(cls, chunks: Dict, len_audio_ms: Optional[int] = None) -> "SegmentTable":
+        """
+        Builds the table from the chunk dicts of the pipeline stages.
+        """
+        values = list(chunks.values())
+        table = np.empty(len(values), dtype=CHUNK_DTYPE)
+        table["id"] = list(chunks)
+        table["start"] = [c["orig_seg"]["start"] * SAMPLES_PER_MS for c in values]
+        table["end"] = [c["orig_seg"]["end"] * SAMPLES_PER_MS for c in values]
+        fields = [f for f in FIELDS if values and all(f in c for c in values)]
+
+        speech, asr, asr_text = [], [], []
+        for row, chunk in enumerate(values):
+            offset = table["start"][row]
+            for seg in chunk.get("speech_boundary") or []:
+                speech.append((row, offset + seg["start"], offset + seg["end"]))
+            for group, segments in enumerate(chunk.get("asr_result") or []):
+                for seg in segments:
+                    asr.append((row, group, seg["start"], seg["end"]))
+                    asr_text.append(seg["text"])
+        return cls(
+            table,
+            speech=np.array(speech, dtype=SPEECH_DTYPE),
+            asr=np.array(asr, dtype=ASR_DTYPE),
+            asr_text=_object_column(asr_text),
+            translation=_object_column([c.get("translated_text") for c in values]),
+            paths=_object_column([c.get("path") for c in values]),
+            fields=fields,
+            len_audio_ms=len_audio_ms,
+        )
+
+    def to_chunks(self) -> Dict[int, Dict]:
+        """
+        The chunk dicts of the pipeline stages.
+        """
+        starts_ms = self.chunks["start"] // SAMPLES_PER_MS
+        ends_ms = self.chunks["end"] // SAMPLES_PER_MS
+        speech_rows = np.searchsorted(self.speech["chunk"], np.arange(len(self) + 1))
+        result = {}
+        for row, chunk_id in enumerate(self.chunks["id"].tolist()):
+            start, end = int(starts_ms[row]), int(ends_ms[row])
+            chunk = {"path": self.paths[row], "len": round((end - start) / 1000, 1), "orig_seg": {"start": start, "end": end}}
+            if "speech_boundary" in self.fields:
+                speech = self.speech[speech_rows[row]:speech_rows[row + 1]]
+                offset = int(self.chunks["start"][row])
+                chunk["speech_boundary"] = [
+                    {"start": s - offset, "end": e - offset} for s, e in zip(speech["start"].tolist(), speech["end"].tolist())
+                ]
+            if "asr_result" in self.fields:
+                chunk["asr_result"] = []
+            if "translated_text" in self.fields:
+                chunk["translated_text"] = self.translation[row]
+            result[chunk_id] = chunk
+
+        if "asr_result" in self.fields:
+            ids = self.chunks["id"].tolist()
+            for (row, group, start, end), text in zip(self.asr.tolist(), self.asr_text):
+                groups = result[ids[row]]["asr_result"]
+                while len(groups) <= group:
+                    groups.append([])
+                groups[group].append({"start": start, "end": end, "text": text})
+        return result
+
+    def lengths(self) -> np.ndarray:
+        """
+        Chunk lengths, s, rounded to 0.1 s like `chunk["len"]`.
+        """
+        return round_seconds((self.chunks["end"] - self.chunks["start"]) // SAMPLES_PER_MS, 1000, digits=1)
+
+    def first_speech(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The first speech piece of every chunk, the slot its dubbed speech is fitted into.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: start and end relative to the chunk, s, rounded
+            to 10 ms, and whether the chunk has speech.
+        """
+        first = np.searchsorted(self.speech["chunk"], np.arange(len(self)))
+        has_speech = first < len(self.speech)
+        has_speech[has_speech] = self.speech["chunk"][first[has_speech]] == np.flatnonzero(has_speech)
+        rows = np.where(has_speech, first, 0)
+        start = np.zeros(len(self))
+        end = np.zeros(len(self))
+        if len(self.speech):
+            offset = self.chunks["start"]
+            start = np.where(has_speech, round_seconds(self.speech["start"][rows] - offset, SAMPLE_RATE), 0.0)
+            end = np.where(has_speech, round_seconds(self.speech["end"][rows] - offset, SAMPLE_RATE), 0.0)
+        return start, end, has_speech
+
+    def fit_boundaries(self, durations: Sequence[float]) -> List[Dict]:
+        """
+        `fit_boundaries` over all chunks. Returns {"start", "end"} in the chunk, s, for every chunk,
+        an empty dict for chunks without speech.
+        """
+        speech_start, speech_end, has_speech = self.first_speech()
+        start, end = fit_boundaries(speech_start, speech_end, self.lengths(), np.asarray(durations, dtype=np.float64))
+        return [
+            {"start": s, "end": e} if speech else {}
+            for s, e, speech in zip(start.tolist(), end.tolist(), has_speech.tolist())
+        ]
+
+    def save(self, path: str) -> str:
+        """
+        Writes the table as an uncompressed npz file (no pickled objects).
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        arrays = {"chunks": self.chunks, "speech": self.speech, "asr": self.asr}
+        for name in ("asr_text", "translation", "paths"):
+            arrays[f"{name}_data"], arrays[f"{name}_offsets"], arrays[f"{name}_missing"] = _pack_strings(getattr(self, name))
+        meta = {"fields": list(self.fields), "len_audio_ms": self.len_audio_ms}
+        arrays["meta"] = np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "SegmentTable":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+            strings = {
+                name: _unpack_strings(data[f"{name}_data"], data[f"{name}_offsets"], data[f"{name}_missing"])
+                for name in ("asr_text", "translation", "paths")
+            }
+            return cls(
+                data["chunks"], data["speech"], data["asr"],
+                fields=meta["fields"], len_audio_ms=meta["len_audio_ms"], **strings,
+            )
+
+    def save_json(self, path: str) -> str:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"len_audio_ms": self.len_audio_ms, "chunks": self.to_chunks()}, f, ensure_ascii=False)
+        return path
+
+    @classmethod
+    def load_json(cls, path: str) -> "SegmentTable":
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls.from_chunks({int(i): c for i, c in data["chunks"].items()}, data["len_audio_ms"])
@@ -0,0 +1,145 @@
+import wave
+from typing import List
+
+import numpy as np
+
+
+class SilenceDetector:
+    """
+    Vectorized, block-streaming equivalent of `pydub.silence.detect_nonsilent`.
+
+    Audio is fed in blocks and only the per-millisecond energy is kept, so long files never
+    have to be loaded at once. Window RMS is computed from cumulative sums with the same
+    integer arithmetic and ms-to-frame rounding as pydub, so the ranges match exactly.
+    Energy is summed in int64, or in float64 as in `audioop.rms` for 32-bit PCM, whose
+    squares overflow int64.
+
+    Args:
+        sample_rate (int): Sample rate of the audio.
+        channels (int): Number of channels.
+        sample_width (int): Bytes per sample of the PCM data.
+    """
+
+    def __init__(self, sample_rate: int, channels: int = 1, sample_width: int = 2):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.n_frames = 0
+        self._dtype = np.int64 if sample_width <= 2 else np.float64
+        self._buckets: List[np.ndarray] = []
+        self._tail = np.zeros(0, dtype=self._dtype) # per-frame energy not assigned to a ms bucket yet
+        self._tail_start = 0
+        self._next_ms = 0
+
+    @classmethod
+    def from_wav(cls, path: str, block_size: int = 1 << 20) -> "SilenceDetector":
+        with wave.open(path, "rb") as reader:
+            detector = cls(reader.getframerate(), reader.getnchannels(), reader.getsampwidth())
+            dtype = {1: np.uint8, 2: np.int16, 4: np.int32}[detector.sample_width]
+            while True:
+                block = np.frombuffer(reader.readframes(block_size), dtype=dtype)
+                if not block.size:
+                    break
+                if detector.sample_width == 1:
+                    block = block.astype(np.int16) - 128
+                detector.feed(block.reshape(-1, detector.channels))
+        return detector
+
+    def _frame(self, ms: np.ndarray) -> np.ndarray:
+        # AudioSegment._parse_position
+        return (ms * (self.sample_rate / 1000.0)).astype(np.int64)
+
+    def feed(self, block: np.ndarray) -> None:
+        """
+        Adds a block of frames, integer PCM or float in [-1, 1), shape (frames, channels).
+        """
+        if block.dtype.kind == "f":
+            block = np.rint(block.astype(np.float64) * float(1 << (8 * self.sample_width - 1)))
+        energy = np.square(block.astype(self._dtype)).reshape(len(block), -1).sum(axis=1)
+        self._tail = np.concatenate([self._tail, energy])
+        self.n_frames += len(block)
+        last_ms = int(self.n_frames / (self.sample_rate / 1000.0))
+        while last_ms > self._next_ms and self._frame(np.array(last_ms)) > self.n_frames:
+            last_ms -= 1
+        self._emit(last_ms)
+
+    def _emit(self, last_ms: int) -> None:
+        if last_ms <= self._next_ms:
+            return
+        bounds = self._frame(np.arange(self._next_ms, last_ms + 1)) - self._tail_start
+        bounds = np.minimum(bounds, len(self._tail)) # missing frames at the end are silence, as in pydub
+        cumsum = np.concatenate([[0], np.cumsum(self._tail)])
+        self._buckets.append(cumsum[bounds[1:]] - cumsum[bounds[:-1]])
+        self._tail = self._tail[bounds[-1]:]
+        self._tail_start += bounds[-1]
+        self._next_ms = last_ms
+
+    def __len__(self) -> int:
+        # AudioSegment.__len__
+        return round(1000 * (self.n_frames / self.sample_rate))
+
+    def detect_silence(self, min_silence_len: int = 1000, silence_thresh: float = -16, seek_step: int = 1) -> List:
+        seg_len = len(self)
+        if seg_len < min_silence_len:
+            return []
+        self._emit(seg_len)
+        energy = np.concatenate(self._buckets) if self._buckets else np.zeros(0, dtype=self._dtype)
+        energy = np.pad(energy, (0, max(0, seg_len - len(energy))))
+
+        threshold = 10 ** (silence_thresh / 20) * (2 ** (8 * self.sample_width) / 2)
+        last_start = seg_len - min_silence_len
+        starts = np.arange(0, last_start + 1, seek_step)
+        if last_start % seek_step:
+            starts = np.append(starts, last_start)
+
+        cumsum = np.concatenate([[0], np.cumsum(energy)])
+        window_energy = (cumsum[starts + min_silence_len] - cumsum[starts]).astype(np.float64)
+        window_len = (self._frame(starts + min_silence_len) - self._frame(starts)) * self.channels
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rms = np.where(window_len > 0, np.floor(np.sqrt(window_energy / window_len)), 0)
+        silence_starts = starts[rms <= threshold]
+        if not len(silence_starts):
+            return []
+
+        prev, current = silence_starts[:-1], silence_starts[1:]
+        breaks = np.flatnonzero((current != prev + seek_step) & (current > prev + min_silence_len)) + 1
+        range_starts = silence_starts[np.concatenate([[0], breaks])]
+        range_ends = silence_starts[np.concatenate([breaks - 1, [len(silence_starts) - 1]])] + min_silence_len
+        return [[int(s), int(e)] for s, e in zip(range_starts, range_ends)]
+
+    def detect_nonsilent(self, min_silence_len: int = 1000, silence_thresh: float = -16, seek_step: int = 1) -> List:
+        silent_ranges = self.detect_silence(min_silence_len, silence_thresh, seek_step)
+        len_seg = len(self)
+        if not silent_ranges:
+            return [[0, len_seg]]
+        if silent_ranges[0][0] == 0 and silent_ranges[0][1] == len_seg:
+            return []
+
+        nonsilent_ranges, prev_end = [], 0
+        for start, end in silent_ranges:
+            nonsilent_ranges.append([prev_end, start])
+            prev_end = end
+        if end != len_seg:
+            nonsilent_ranges.append([prev_end, len_seg])
+        if nonsilent_ranges[0] == [0, 0]:
+            nonsilent_ranges.pop(0)
+        return nonsilent_ranges
+
+
+def detect_nonsilent(
+    samples: np.ndarray,
+    sample_rate: int,
+    min_silence_len: int = 1000,
+    silence_thresh: float = -16,
+    seek_step: int = 1,
+    sample_width: int = 2,
+    block_size: int = 1 << 20,
+) -> List:
+    """
+    Returns nonsilent [start, end] ranges in ms of `samples` (frames, channels), fed block by block.
+    """
+    samples = samples.reshape(len(samples), -1)
+    detector = SilenceDetector(sample_rate, samples.shape[1], sample_width)
+    for b in range(0, len(samples), block_size):
+        detector.feed(samples[b:b + block_size])
+    return detector.detect_nonsilent(min_silence_len, silence_thresh, seek_step)
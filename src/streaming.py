@@ -0,0 +1,61 @@
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, List
+
+_END = object()
+
+
+def run_stages(items: Iterable, stages: List[Callable[[Any], Any]], queue_size: int = 2) -> Iterator:
+    """
+    Streams items through `stages`. Every stage runs in its own thread and stages are connected
+    by bounded queues, so stage n can work on item k+1 while stage n+1 works on item k, and at most
+    `queue_size` items wait between two stages.
+
+    Args:
+        items (Iterable): Input items.
+        stages (List[Callable]): Functions applied in order, each takes the output of the previous one.
+        queue_size (int): Capacity of every queue between stages.
+    Returns:
+        Iterator: outputs of the last stage, in input order.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    errors = []
+
+    def feed():
+        try:
+            for item in items:
+                if errors:
+                    break
+                queues[0].put(item)
+        except Exception as e:
+            errors.append(e)
+        queues[0].put(_END)
+
+    def work(fn, in_q, out_q):
+        while True:
+            item = in_q.get()
+            if item is _END:
+                out_q.put(_END)
+                return
+            if errors:  # keep draining so upstream stages never block
+                continue
+            try:
+                out_q.put(fn(item))
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    for fn, in_q, out_q in zip(stages, queues[:-1], queues[1:]):
+        threads.append(threading.Thread(target=work, args=(fn, in_q, out_q), daemon=True))
+    for t in threads:
+        t.start()
+
+    while True:
+        item = queues[-1].get()
+        if item is _END:
+            break
+        yield item
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
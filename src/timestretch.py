@@ -0,0 +1,73 @@
+from typing import Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _hann(n: int) -> np.ndarray:
+    # periodic window, overlap-adds to exactly 1 with a hop of n / 2
+    return (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n) / n)).astype(np.float32)
+
+def stretched_length(n_samples: int, rate: float) -> int:
+    return int(round(n_samples / rate))
+
+def wsola(
+    audio: np.ndarray,
+    rate: float,
+    sample_rate: int,
+    out: Optional[np.ndarray] = None,
+    frame_ms: float = 30,
+    tolerance_ms: float = 10,
+) -> np.ndarray:
+    """
+    Changes the tempo of mono audio by `rate` (>1 is faster) without changing the pitch,
+    with waveform-similarity overlap-add (WSOLA).
+
+    Args:
+        audio (np.ndarray): Mono float32 audio.
+        rate (float): Tempo factor, the output has `len(audio) / rate` samples.
+        sample_rate (int): Sample rate of the audio.
+        out (Optional[np.ndarray]): Preallocated output of `stretched_length(len(audio), rate)` samples.
+        frame_ms (float): Analysis frame length.
+        tolerance_ms (float): Max shift of an analysis frame when searching for the best overlap.
+    Returns:
+        np.ndarray: stretched audio (`out` if given).
+    """
+    out_len = stretched_length(len(audio), rate)
+    if out is None:
+        out = np.empty(out_len, dtype=np.float32)
+    if out_len == 0 or len(audio) == 0:
+        out[:] = 0
+        return out
+    if out_len == len(audio):
+        out[:] = audio
+        return out
+
+    frame = max(2, int(sample_rate * frame_ms / 1000) // 2 * 2)
+    hop = frame // 2
+    tol = int(sample_rate * tolerance_ms / 1000)
+    analysis_hop = hop * rate
+    # frames start one hop before the signal, so every output sample is covered by two frames
+    n_frames = -(-out_len // hop) + 2
+    last = max(0, len(audio) + hop - frame - tol) # candidates stay inside the signal
+
+    padded = np.zeros(2 * tol + hop + len(audio) + frame, dtype=np.float32)
+    padded[tol + hop:tol + hop + len(audio)] = audio
+    window = _hann(frame)
+    acc = np.zeros(n_frames * hop + frame, dtype=np.float32)
+
+    prev = 0
+    for k in range(n_frames):
+        nominal = min(int(round(k * analysis_hop)), last)
+        if k == 0:
+            pos = tol
+        else:
+            # the candidate most similar to the natural continuation of the previous frame
+            template = padded[prev + hop:prev + hop + frame]
+            candidates = sliding_window_view(padded[nominal:nominal + 2 * tol + frame], frame)
+            pos = nominal + int(np.argmax(candidates @ template))
+        acc[k * hop:k * hop + frame] += window * padded[pos:pos + frame]
+        prev = pos
+
+    out[:] = acc[hop:hop + out_len]
+    return out
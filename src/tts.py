@@ -1,23 +1,161 @@
+import hashlib
+import json
+import multiprocessing as mp
 import os
-from typing import Dict, List, Optional, Union
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple, Union
 
-from TTS.api import TTS
-from TTS.tts.configs.xtts_config import XttsConfig
-from TTS.tts.models.xtts import Xtts
+import numpy as np
 
-from src.helpers import split_long_string
+from src.audio import as_float32, empty_audio, join_audio
+from src.cache import AudioCache
+from src.helpers import file_hash, save_wav, split_long_string
+from src.profiling import span
+
+if TYPE_CHECKING:
+    import torch
+
+SAMPLE_RATE = 24000 # XTTS v2 output
+GPT_TOKENS_PER_S = 21.5 # XTTS v2 GPT audio codes per second of speech at speed 1 (22050 Hz / 1024)
+VAD_SAMPLE_RATE = 16000 # speech boundaries of the chunks
+EMBEDDING_SAMPLE_RATE = 16000 # input of the XTTS v2 speaker encoder
+EMBEDDING_DIM = 512
+SENTENCE_PAUSE = 10000 # samples of silence after every sentence, as the TTS API joins them
+CONDITIONING_VERSION = 2 # part of the speaker key, bumped when the voice conditioning changes
+
+_worker_model = None
+
+
+def _init_worker(model_kwargs: Dict, torch_threads: int):
+    global _worker_model
+    import torch
+    torch.set_num_threads(torch_threads)
+    _worker_model = XTTSv2(**model_kwargs).load()
+
+def speech_slot(chunk: Dict) -> float:
+    """
+    Duration of the slot the dubbed speech of a chunk is fitted into, s: its first VAD speech piece,
+    as in `update_boundary`. 0 if the chunk has no speech.
+    """
+    speech = chunk.get("speech_boundary")
+    if not speech:
+        return 0.0
+    return (speech[0]["end"] - speech[0]["start"]) / VAD_SAMPLE_RATE
+
+def plan_budget(
+    text: str,
+    slot_s: float,
+    speed: float,
+    max_speed: float,
+    chars_per_s: float,
+    min_chars_per_s: float,
+    token_margin: float,
+) -> Dict:
+    """
+    Synthesis parameters of a text for a slot of `slot_s` seconds, a pure function of its arguments.
+
+    The speed is raised from `speed` up to `max_speed` so that the expected duration of the text
+    (`chars_per_s` characters per second at speed 1) fits the slot. The GPT token cap allows
+    `token_margin` times the duration of the text at the slowest expected rate, `min_chars_per_s`,
+    so it stops runaway generations but does not cut slow speech.
+
+    Returns:
+        Dict: `speed` and `max_new_tokens`.
+    """
+    if slot_s > 0:
+        speed = float(np.clip(len(text) / chars_per_s / slot_s, speed, max(speed, max_speed)))
+    longest_s = len(text) / min_chars_per_s # GPT tokens are generated at speed 1
+    max_new_tokens = int(np.ceil(max(longest_s, 1.0) * GPT_TOKENS_PER_S * token_margin))
+    return {"speed": round(speed, 2), "max_new_tokens": max_new_tokens}
+
+def length_batches(lengths: Sequence[int], batch_size: int, tolerance: float) -> List[List[int]]:
+    """
+    Groups the indices of clips, longest first, into batches of at most `batch_size` clips that are
+    at most `tolerance` (a share) shorter than the longest clip of their batch. Empty clips are left out.
+    """
+    lengths = np.asarray(lengths)
+    batches, batch = [], []
+    for i in np.argsort(-lengths, kind="stable").tolist():
+        if lengths[i] == 0:
+            break
+        if batch and (len(batch) == batch_size or lengths[i] < lengths[batch[0]] * (1 - tolerance)):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+def _worker_tts(text: str, speaker_wav: Union[str, List], params: Dict) -> np.ndarray:
+    return as_float32(_worker_model.tts(text, speaker_wav, **params))
+
+def _worker_ready(_) -> bool:
+    return _worker_model is not None
 
 
 class XTTSv2:
+    """
+    XTTS v2 synthesis. The model (or, with `workers` > 1, the worker pool) is started on first use,
+    or with `load()`.
+    """
+
     def __init__(
         self,
         checkpoint_dir: Optional[str] = None,
         vocab: Optional[str] = None,
         device: str = "cpu",
+        latents_dir: Optional[str] = None,
+        audio_cache_dir: Optional[str] = None,
+        audio_cache_mb: int = 2048,
+        workers: int = 1,
+        worker_threads: int = 1,
     ):
         self.checkpoint = False
+        self.workers = workers
+        self.worker_threads = worker_threads
+        self._pool = None
+        self._model_kwargs = dict(checkpoint_dir=checkpoint_dir, vocab=vocab, device=device, latents_dir=latents_dir)
+        self.latents_dir = latents_dir
+        self.audio_cache = AudioCache(audio_cache_dir, audio_cache_mb << 20) if audio_cache_dir else None
+        self._latents: Dict[str, Tuple["torch.Tensor", "torch.Tensor"]] = {}
+        self._segmenter = None
+        self._speaker_hashes: Dict[Tuple, str] = {}
+        self.sample_counts = {"generated": 0, "cut": 0}
         if checkpoint_dir:
             self.model_config = os.path.join(checkpoint_dir, "config.json")
+            checkpoint_path = os.path.join(checkpoint_dir, "best_model.pth")
+            stat = os.stat(checkpoint_path)
+            self.model_id = f"{os.path.abspath(checkpoint_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        else:
+            self.model_id = "tts_models/multilingual/multi-dataset/xtts_v2"
+
+        self.model, self._xtts = None, None
+        self._load_lock = threading.Lock()
+
+    @property
+    def xtts(self):
+        with self._load_lock:
+            if self._xtts is None:
+                kwargs = self._model_kwargs
+                self._load_model(kwargs["checkpoint_dir"], kwargs["vocab"], kwargs["device"])
+        return self._xtts
+
+    def load(self) -> "XTTSv2":
+        """
+        Loads the model, or with a worker pool starts the workers and waits until each has loaded its own.
+        """
+        if self.workers <= 1:
+            self.xtts
+        else:
+            list(self._get_pool().map(_worker_ready, range(self.workers)))
+        return self
+
+    def _load_model(self, checkpoint_dir: Optional[str], vocab: Optional[str], device: str):
+        if checkpoint_dir:
+            from TTS.tts.configs.xtts_config import XttsConfig
+            from TTS.tts.models.xtts import Xtts
 
             config = XttsConfig()
             config.load_json(self.model_config)
@@ -28,10 +166,12 @@ class XTTSv2:
                 vocab_path=vocab,
             )
             self.model = model
+            self._xtts = model
 
         else:
-            model_name = "tts_models/multilingual/multi-dataset/xtts_v2"
-            self.model = TTS(model_name).to(device)
+            from TTS.api import TTS
+            self.model = TTS(self.model_id).to(device)
+            self._xtts = self.model.synthesizer.tts_model
 
     def tts(
         self,
@@ -43,29 +183,24 @@ class XTTSv2:
         speed: float = 1,
         length_penalty: int = 1,
         repetition_penalty: float = 10.0,
-        temperature: float = 0.3
+        temperature: float = 0.3,
+        max_new_tokens: Optional[int] = None,
     ):
         if self.checkpoint:
             raise AttributeError("Using wrong method. Use 'XTTSv2.inference()'.")
+        audio = self.inference(
+            text,
+            speaker_wav,
+            language=language,
+            speed=speed,
+            length_penalty=length_penalty,
+            repetition_penalty=repetition_penalty,
+            temperature=temperature,
+            max_new_tokens=max_new_tokens,
+        )
         if save and output_path is not None:
-            self.model.tts_to_file(
-                text = text,
-                speaker_wav=speaker_wav,
-                language=language,
-                file_path=output_path,
-                speed=speed,
-                temperature=temperature
-            )
+            save_wav(audio, output_path)
         else:
-            audio = self.model.tts(
-                text = text,
-                speaker_wav=speaker_wav,
-                language=language,
-                speed=speed,
-                length_penalty = length_penalty,
-                repetition_penalty = repetition_penalty,
-                temperature=temperature
-            )
             return audio
 
     def tts_chunks(
@@ -76,45 +211,129 @@ class XTTSv2:
         length_penalty: int = 1,
         repetition_penalty: float = 10.0,
         temperature: float = 0.3,
-        cutoff: Optional[float] = None
-    ):
-        result_chunks = []
+        cutoff: Optional[float] = None,
+        budget: bool = False,
+        max_speed: float = 1.6,
+        chars_per_s: float = 14.0,
+        min_chars_per_s: float = 8.0,
+        token_margin: float = 1.3,
+    ) -> List[np.ndarray]:
+        """
+        Synthesizes the translated text of every chunk into a float32 array, empty for chunks without text.
+
+        With `budget` every chunk gets its own speed and GPT token cap from the length of its speech
+        slot (see `plan_budget`), so the output mostly fits the slot without cutting or stretching.
+        The plan depends only on the text, the slot and the config, so re-runs find the same audio cache keys.
+        """
+        params = dict(
+            language=language,
+            speed=speed,
+            temperature=temperature,
+            length_penalty=length_penalty,
+            repetition_penalty=repetition_penalty,
+        )
+        chunk_params = []
         for chunk in chunks.values():
-            if not chunk["translated_text"]:
-                result_chunks.append([])
-                continue
             text = chunk["translated_text"]
-            if len(text) > 182: # limit from xTTSv2 for ru version
-                result_audio = []
-                text_list = split_long_string(text)
-                for txt in text_list:
-                    audio_seg = self.tts(
-                        txt,
-                        speaker_wav,
-                        language=language,
-                        speed=speed,
-                        temperature=temperature,
-                        length_penalty=length_penalty,
-                        repetition_penalty=repetition_penalty,
-                    )
-                    result_audio.extend(list(audio_seg))
-            else:
-                result_audio = self.tts(
-                    text,
-                    speaker_wav,
-                    language=language,
-                    speed=speed,
-                    temperature=temperature,
-                    length_penalty=length_penalty,
-                    repetition_penalty=repetition_penalty,
+            if budget and text and speech_slot(chunk) > 0:
+                plan = plan_budget(
+                    text, speech_slot(chunk), speed, max_speed, chars_per_s, min_chars_per_s, token_margin
                 )
-            if cutoff:
-                cut_idx = len(result_audio) - int(len(result_audio) * cutoff)
-                result_chunks.append(result_audio[:cut_idx])
+                chunk_params.append({**params, **plan})
             else:
-                result_chunks.append(result_audio)
+                chunk_params.append(params)
+
+        with span("tts.tts_chunks", chunk=list(chunks)) as record:
+            result_chunks = self._tts_chunks(chunks, speaker_wav, chunk_params, record["counts"])
+            record["audio_s"] = sum(len(audio) for audio in result_chunks) / SAMPLE_RATE
+            generated = sum(len(audio) for audio in result_chunks)
+            if cutoff:
+                for idx, result_audio in enumerate(result_chunks):
+                    cut_idx = len(result_audio) - int(len(result_audio) * cutoff)
+                    result_chunks[idx] = result_audio[:cut_idx] # a view, not a copy
+            cut = generated - sum(len(audio) for audio in result_chunks)
+            record["counts"].update(generated_samples=generated, cut_samples=cut)
+        self.sample_counts["generated"] += generated
+        self.sample_counts["cut"] += cut
+        return result_chunks
+
+    def _tts_chunks(
+        self, chunks: Dict, speaker_wav: Union[str, List], chunk_params: List[Dict], counts: Dict
+    ) -> List:
+        """
+        Synthesizes the text of every chunk with its parameters, or takes it from the audio cache.
+        """
+        result_chunks, cache_keys, texts, text_params, owners = [], [], [], [], []
+        counts.update(cache_hits=0, texts=0, characters=0)
+        for chunk, params in zip(chunks.values(), chunk_params):
+            text = chunk["translated_text"]
+            result_audio, cache_key = None, None
+            if text and self.audio_cache is not None:
+                cache_key = self.audio_cache.key(
+                    text=text, speaker=self.speaker_hash(speaker_wav), model=self.model_id, **params
+                )
+                result_audio = self.audio_cache.get(cache_key)
+                counts["cache_hits"] += result_audio is not None
+            if text and result_audio is None:
+                # texts over the xTTSv2 limit for the ru version are synthesized by parts
+                text_list = split_long_string(text) if len(text) > 182 else [text]
+                texts.extend(text_list)
+                for part in text_list: # the token budget is shared by the parts
+                    part_params = dict(params)
+                    if "max_new_tokens" in params:
+                        part_params["max_new_tokens"] = int(np.ceil(params["max_new_tokens"] * len(part) / len(text)))
+                    text_params.append(part_params)
+                owners.extend([len(result_chunks)] * len(text_list))
+            result_chunks.append(result_audio if text else empty_audio())
+            cache_keys.append(cache_key)
+
+        counts["texts"] = len(texts)
+        counts["characters"] = sum(len(text) for text in texts)
+
+        chunk_ids = list(chunks)
+        parts = [[] for _ in result_chunks]
+        synthesized = self._synthesize_many(texts, speaker_wav, [chunk_ids[idx] for idx in owners], text_params)
+        for idx, audio_seg in zip(owners, synthesized):
+            parts[idx].append(audio_seg)
+        for idx in sorted(set(owners)):
+            result_chunks[idx] = join_audio(parts[idx])
+            if cache_keys[idx] is not None:
+                self.audio_cache.put(cache_keys[idx], result_chunks[idx])
         return result_chunks
 
+    def _synthesize_many(
+        self, texts: List[str], speaker_wav: Union[str, List], chunk_ids: List, params: List[Dict]
+    ) -> List:
+        """
+        Synthesizes texts in order, each with its parameters, on the worker pool if `workers` > 1.
+        """
+        if self.workers <= 1:
+            results = []
+            for text, chunk_id, text_params in zip(texts, chunk_ids, params):
+                with span("tts.synthesize", chunk=chunk_id, characters=len(text)) as record:
+                    results.append(as_float32(self.tts(text, speaker_wav, **text_params)))
+                    record["audio_s"] = len(results[-1]) / SAMPLE_RATE
+            return results
+        with span("tts.pool", chunk=sorted(set(chunk_ids)), texts=len(texts)):
+            return list(self._get_pool().map(_worker_tts, texts, repeat(speaker_wav), params))
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # every worker loads its own model
+        with self._load_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=mp.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self._model_kwargs, self.worker_threads),
+                )
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
     def inference(
         self,
         text: str,
@@ -124,27 +343,131 @@ class XTTSv2:
         length_penalty: int = 1,
         repetition_penalty: float = 10.0,
         temperature: float = 0.3,
-    ):
+        max_new_tokens: Optional[int] = None,
+    ) -> np.ndarray:
+        """
+        Synthesizes the text sentence by sentence with the cached conditioning of the reference audio,
+        joined with `SENTENCE_PAUSE` samples of silence after every sentence, as the TTS API does.
+        `max_new_tokens` is shared by the sentences by their length.
+        """
         if self.checkpoint is None:
             AttributeError("Checkpoint not loaded. Use 'XTTSv2.tts()'.")
         gpt_cond_latent, speaker_embedding = self.get_cond_latents(speaker_wav)
+        config = self.xtts.config
+        sentences = self._split_sentences(text)
+        wavs = []
+        for sentence in sentences:
+            # passed on to the GPT `generate`, takes precedence over the model's max_length
+            generate_kwargs = {}
+            if max_new_tokens:
+                generate_kwargs["max_new_tokens"] = int(np.ceil(max_new_tokens * len(sentence) / len(text)))
+            output = self.xtts.inference(
+                sentence,
+                language,
+                gpt_cond_latent,
+                speaker_embedding,
+                speed = speed,
+                temperature=temperature,
+                length_penalty=length_penalty,
+                repetition_penalty=repetition_penalty,
+                top_k=config.top_k,
+                top_p=config.top_p,
+                **generate_kwargs,
+            )
+            wavs.extend([as_float32(output["wav"]), np.zeros(SENTENCE_PAUSE, dtype=np.float32)])
+        return join_audio(wavs) if wavs else empty_audio()
 
-        output = self.model.inference(
-            text,
-            language,
-            gpt_cond_latent,
-            speaker_embedding,
-            speed = speed,
-            temperature=temperature,
-            length_penalty=length_penalty,
-            repetition_penalty=repetition_penalty,
-        )
-        return output["wav"]
+    def _split_sentences(self, text: str) -> List[str]:
+        if self._segmenter is None:
+            import pysbd
+            self._segmenter = pysbd.Segmenter(language="en", clean=True) # the segmenter of the TTS API
+        return [sentence for sentence in self._segmenter.segment(text) if sentence.strip()]
+
+    def _cond_settings(self) -> Dict:
+        """
+        Voice cloning settings of the model config, which `Xtts.synthesize` (and so the TTS API) conditions with.
+        """
+        config = self.xtts.config
+        return {
+            "gpt_cond_len": config.gpt_cond_len,
+            "gpt_cond_chunk_len": config.gpt_cond_chunk_len,
+            "max_ref_length": config.max_ref_len,
+            "sound_norm_refs": config.sound_norm_refs,
+        }
+
+    def speaker_hash(self, speaker_wav: Union[str, List]) -> str:
+        """
+        Key of the reference audio: its content hash and `CONDITIONING_VERSION`.
+        """
+        paths = [speaker_wav] if isinstance(speaker_wav, str) else sorted(speaker_wav)
+        stat_key = tuple((p, os.stat(p).st_mtime_ns, os.stat(p).st_size) for p in paths)
+        if stat_key not in self._speaker_hashes:
+            self._speaker_hashes[stat_key] = f"{file_hash(paths)}-v{CONDITIONING_VERSION}"
+        return self._speaker_hashes[stat_key]
 
-    def get_cond_latents(self, speaker_wav: Union[str, List]):
+    def speaker_embedding(self, speaker_wav: Union[str, List]) -> np.ndarray:
+        """
+        Speaker embedding of the reference audio, cached with its conditioning latents.
+        """
+        return self.get_cond_latents(speaker_wav)[1].float().cpu().numpy().reshape(-1)
+
+    def speaker_embeddings(
+        self,
+        audios: Sequence[np.ndarray],
+        sample_rate: int = SAMPLE_RATE,
+        batch_size: int = 16,
+        max_s: float = 10.0,
+        tolerance: float = 0.1,
+    ) -> np.ndarray:
+        """
+        Speaker embeddings of many clips, e.g. synthesized chunks, with the speaker encoder of the model
+        in batches of clips of similar length. Clips are cut to `max_s` seconds and every batch to its
+        shortest clip, so no padding enters the pooled statistics.
+
+        Returns:
+            np.ndarray: (len(audios), EMBEDDING_DIM) float32 L2-normalized embeddings, NaN for empty clips.
+        """
+        import torch
+        import torchaudio
+        encoder = self.xtts.hifigan_decoder.speaker_encoder
+        lengths = [min(len(audio), int(max_s * sample_rate)) for audio in audios]
+        embeddings = np.full((len(audios), EMBEDDING_DIM), np.nan, dtype=np.float32)
+        for batch in length_batches(lengths, batch_size, tolerance):
+            n = lengths[batch[-1]]
+            with span("tts.speaker_embeddings", clips=len(batch), audio_s=n * len(batch) / sample_rate):
+                wavs = torch.from_numpy(np.stack([as_float32(audios[i])[:n] for i in batch]))
+                wavs = torchaudio.functional.resample(wavs, sample_rate, EMBEDDING_SAMPLE_RATE)
+                with torch.inference_mode():
+                    embeddings[batch] = encoder.forward(wavs.to(self.xtts.device), l2_norm=True).float().cpu().numpy()
+        return embeddings
+
+    def get_cond_latents(self, speaker_wav: Union[str, List]) -> Tuple["torch.Tensor", "torch.Tensor"]:
+        """
+        Returns the GPT conditioning latent and the speaker embedding of the reference audio.
+
+        Latents are computed with the cloning settings of the model config (`_cond_settings`) once per
+        reference content, kept in memory for the life of the model and stored under `latents_dir`
+        by the content hash of the reference audio and the settings.
+        """
         if self.checkpoint is None:
             AttributeError("Checkpoint not loaded. Use 'XTTSv2.tts()'.")
-        gpt_cond_latent, speaker_embedding = self.model.get_conditioning_latents(
-            audio_path=speaker_wav
-        )
-        return gpt_cond_latent, speaker_embedding
+        settings = self._cond_settings()
+        settings_hash = hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+        key = f"{self.speaker_hash(speaker_wav)}-{settings_hash}"
+        if key in self._latents:
+            return self._latents[key]
+
+        import torch
+        cache_path = os.path.join(self.latents_dir, f"{key}.pt") if self.latents_dir else None
+        if cache_path and os.path.exists(cache_path):
+            cached = torch.load(cache_path, map_location=self.xtts.device)
+            latents = cached["gpt_cond_latent"], cached["speaker_embedding"]
+        else:
+            latents = self.xtts.get_conditioning_latents(audio_path=speaker_wav, **settings)
+            if cache_path:
+                os.makedirs(self.latents_dir, exist_ok=True)
+                tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                torch.save({"gpt_cond_latent": latents[0], "speaker_embedding": latents[1]}, tmp_path)
+                os.replace(tmp_path, cache_path)
+        self._latents[key] = latents
+        return latents
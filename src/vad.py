@@ -1,33 +1,146 @@
-from typing import Dict, List
+import threading
+from typing import Dict, List, Optional, Tuple
 
-from silero_vad import get_speech_timestamps, load_silero_vad, read_audio
+import numpy as np
 
+from src.audio import AudioStore, ms_to_samples
+from src.profiling import span
 
-def find_timestamps(chunks: Dict, threshold: float = 16000) -> Dict:
-    model = load_silero_vad()
-    for chunk in chunks.values():
-        wav_path = chunk["path"]
-        wav = read_audio(wav_path)
-        raw_timestamps = get_speech_timestamps(
-            wav,
-            model,
-            )
-        timestamps = merge_timestamps(raw_timestamps, threshold=threshold)
-        chunk["speech_boundary"] = timestamps
 
-    return chunks
+class VAD:
+    """
+    Silero VAD over the whole signal.
+
+    The model is loaded once on first use (or with `load()`) and reused. Speech is detected in one pass over
+    the full 16 kHz signal, then the speech intervals are clipped to the chunks, made
+    chunk-relative and merged in one vectorized step, so the cost scales with the audio
+    length alone and not with the number of chunks.
+
+    Args:
+        threshold (float): Max gap between speech intervals of a chunk to merge them, samples.
+        model: Preloaded silero model.
+        sample_rate (int): Sample rate the model runs at.
+        min_speech_ms (int): Shorter speech, also what is left of an interval after clipping to a chunk, is dropped.
+        **vad_kwargs: Passed to `silero_vad.get_speech_timestamps`.
+    """
+
+    def __init__(
+        self, threshold: float = 16000, model=None, sample_rate: int = 16000, min_speech_ms: int = 250, **vad_kwargs
+    ):
+        self.threshold = threshold
+        self.min_speech_ms = min_speech_ms
+        self._model = model
+        self.sample_rate = sample_rate
+        self.vad_kwargs = vad_kwargs
+        self._load_lock = threading.Lock()
+
+    @property
+    def model(self):
+        with self._load_lock:
+            if self._model is None:
+                from silero_vad import load_silero_vad
+                self._model = load_silero_vad()
+        return self._model
+
+    def load(self) -> "VAD":
+        self.model
+        return self
+
+    def speech(self, wav: np.ndarray) -> np.ndarray:
+        """
+        Returns the speech intervals of a mono signal as an (n, 2) array of [start, end) samples.
+        """
+        import torch
+        from silero_vad import get_speech_timestamps
+        timestamps = get_speech_timestamps(
+            torch.from_numpy(np.ascontiguousarray(wav, dtype=np.float32)),
+            self.model,
+            sampling_rate=self.sample_rate,
+            min_speech_duration_ms=self.min_speech_ms,
+            **self.vad_kwargs,
+        )
+        return np.array([[t["start"], t["end"]] for t in timestamps], dtype=np.int64).reshape(-1, 2)
+
+    def find_timestamps(self, chunks: Dict, store: AudioStore) -> Dict:
+        """
+        Sets `speech_boundary` of every chunk: merged speech intervals in samples, relative to the chunk start.
+        """
+        wav = store.mono(self.sample_rate)
+        with span("vad.speech", audio_s=len(wav) / self.sample_rate) as record:
+            speech = self.speech(wav)
+            record["counts"]["speech"] = len(speech)
+        bounds = np.array(
+            [[ms_to_samples(c["orig_seg"]["start"], self.sample_rate),
+              ms_to_samples(c["orig_seg"]["end"], self.sample_rate)] for c in chunks.values()],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        min_length = ms_to_samples(self.min_speech_ms, self.sample_rate)
+        for chunk, timestamps in zip(chunks.values(), assign_speech(speech, bounds, self.threshold, min_length)):
+            chunk["speech_boundary"] = timestamps
+        return chunks
+
+
+def merge_intervals(
+    starts: np.ndarray, ends: np.ndarray, threshold: float, groups: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Merges sorted intervals that are at most `threshold` apart, never across different `groups`.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: starts, ends and the index of the first
+        input interval of every merged interval.
+    """
+    if not len(starts):
+        return starts, ends, np.zeros(0, dtype=np.int64)
+    reach = np.maximum.accumulate(ends)
+    new = np.ones(len(starts), dtype=bool)
+    new[1:] = starts[1:] - reach[:-1] > threshold
+    if groups is not None:
+        new[1:] |= groups[1:] != groups[:-1]
+    first = np.flatnonzero(new)
+    return starts[first], np.maximum.reduceat(ends, first), first
+
+def assign_speech(
+    speech: np.ndarray, bounds: np.ndarray, threshold: float, min_length: int = 0
+) -> List[List[Dict]]:
+    """
+    Clips speech intervals of the whole signal to chunk bounds and merges them per chunk.
+
+    Args:
+        speech (np.ndarray): (n, 2) sorted speech intervals, samples.
+        bounds (np.ndarray): (k, 2) sorted chunk [start, end) bounds, samples.
+        threshold (float): Max gap to merge, samples.
+        min_length (int): Clipped intervals shorter than this are dropped, samples.
+    Returns:
+        List[List[Dict]]: chunk-relative {"start", "end"} intervals for every chunk.
+    """
+    first = np.searchsorted(speech[:, 1], bounds[:, 0], side="right")
+    last = np.searchsorted(speech[:, 0], bounds[:, 1], side="left")
+    counts = np.maximum(last - first, 0)
+    chunk_ids = np.repeat(np.arange(len(bounds)), counts)
+    idx = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+    starts = np.maximum(speech[idx, 0], bounds[chunk_ids, 0])
+    ends = np.minimum(speech[idx, 1], bounds[chunk_ids, 1])
+    keep = ends - starts >= min_length
+    starts, ends, chunk_ids = starts[keep], ends[keep], chunk_ids[keep]
+    starts, ends, merged_first = merge_intervals(starts, ends, threshold, chunk_ids)
+    merged_ids = chunk_ids[merged_first]
+    starts -= bounds[merged_ids, 0]
+    ends -= bounds[merged_ids, 0]
+
+    result = [[] for _ in range(len(bounds))]
+    for i, start, end in zip(merged_ids.tolist(), starts.tolist(), ends.tolist()):
+        result[i].append({"start": start, "end": end})
+    return result
+
+def find_timestamps(
+    chunks: Dict, store: AudioStore, threshold: float = 16000, model=None
+) -> Dict:
+    return VAD(threshold=threshold, model=model).find_timestamps(chunks, store)
 
 def merge_timestamps(timestamps: List[Dict], threshold: float) -> List[Dict]:
-    if not timestamps:
-        return []
-
-    merged = [timestamps[0]]
-    
-    for current in timestamps[1:]:
-        last = merged[-1]
-        if current['start'] - last['end'] <= threshold:
-            merged[-1] = {'start': last['start'], 'end': max(last['end'], current['end'])}
-        else:
-            merged.append(current)
-    
-    return merged
+    starts = np.array([t["start"] for t in timestamps], dtype=np.int64)
+    ends = np.array([t["end"] for t in timestamps], dtype=np.int64)
+    starts, ends, _ = merge_intervals(starts, ends, threshold)
+    return [{"start": s, "end": e} for s, e in zip(starts.tolist(), ends.tolist())]
@@ -0,0 +1,203 @@
+"""
+Long-running dubbing worker with warm models and a spool-directory job queue.
+
+Jobs are JSON files in `<spool>/incoming`. The worker claims them in submission order by moving
+them to `running`, runs them on one resident VideoDubPipe and moves them to `done` or `failed`
+with the status, timings and error (if any) written into the job file.
+
+Usage:
+    python -m src.worker serve --config config/config.yaml --spool ../data/spool
+    python -m src.worker submit --spool ../data/spool --input in.wav --output out.wav --tts '{"speed": 1.1}'
+    python -m src.worker status --spool ../data/spool
+"""
+import argparse
+import json
+import os
+import time
+import traceback
+import uuid
+from typing import Dict, List, Optional
+
+from src.pipeline import VideoDubPipe
+
+STATES = ("incoming", "running", "done", "failed")
+
+
+def _write_job(path: str, job: Dict) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(job, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _read_job(path: str) -> Dict:
+    with open(path, "r") as f:
+        return json.load(f)
+
+def submit_job(
+    spool_dir: str,
+    input_path: str,
+    output_path: str,
+    tts: Optional[Dict] = None,
+    postprocess: Optional[Dict] = None,
+    output_dir: Optional[str] = None,
+) -> str:
+    """
+    Adds a job to the queue.
+
+    Args:
+        spool_dir (str): Spool directory of the worker.
+        input_path (str): Audio to dub.
+        output_path (str): Output WAV file.
+        tts (Optional[Dict]): Overrides of the `tts` config section for this job.
+        postprocess (Optional[Dict]): Overrides of the `postprocess` config section for this job.
+        output_dir (Optional[str]): Directory for intermediate results, `<spool>/work/<job_id>` if None.
+    Returns:
+        str: job id.
+    """
+    job_id = f"{time.time_ns()}_{uuid.uuid4().hex[:8]}" # ids sort in submission order
+    job = {
+        "id": job_id,
+        "input": os.path.abspath(input_path),
+        "output": os.path.abspath(output_path),
+        "output_dir": os.path.abspath(output_dir) if output_dir else None,
+        "tts": tts or {},
+        "postprocess": postprocess or {},
+        "status": "incoming",
+        "submitted": time.time(),
+    }
+    incoming = os.path.join(spool_dir, "incoming")
+    os.makedirs(incoming, exist_ok=True)
+    _write_job(os.path.join(incoming, f"{job_id}.json"), job)
+    return job_id
+
+def list_jobs(spool_dir: str) -> List[Dict]:
+    """
+    Returns all jobs of the spool directory with their status, in submission order.
+    """
+    jobs = []
+    for state in STATES:
+        state_dir = os.path.join(spool_dir, state)
+        if os.path.isdir(state_dir):
+            jobs.extend(_read_job(os.path.join(state_dir, name)) for name in os.listdir(state_dir) if name.endswith(".json"))
+    return sorted(jobs, key=lambda job: job["id"])
+
+
+class DubbingWorker:
+    """
+    Runs queued jobs one by one on a single VideoDubPipe, so models are loaded once per worker, not per job.
+
+    Args:
+        pipeline (VideoDubPipe): Pipeline with the models kept in memory.
+        spool_dir (str): Spool directory with the `incoming`, `running`, `done` and `failed` job folders.
+        poll_interval (float): Pause between checks of an empty queue, s.
+    """
+
+    def __init__(self, pipeline: VideoDubPipe, spool_dir: str, poll_interval: float = 1.0):
+        self.pipeline = pipeline
+        self.spool_dir = spool_dir
+        self.poll_interval = poll_interval
+        for state in STATES:
+            os.makedirs(self._dir(state), exist_ok=True)
+        # jobs left running by a stopped worker are run again
+        for name in os.listdir(self._dir("running")):
+            os.replace(os.path.join(self._dir("running"), name), os.path.join(self._dir("incoming"), name))
+
+    def _dir(self, state: str) -> str:
+        return os.path.join(self.spool_dir, state)
+
+    def _claim(self) -> Optional[str]:
+        for name in sorted(n for n in os.listdir(self._dir("incoming")) if n.endswith(".json")):
+            running_path = os.path.join(self._dir("running"), name)
+            try:
+                os.replace(os.path.join(self._dir("incoming"), name), running_path)
+            except FileNotFoundError: # removed by the client
+                continue
+            return running_path
+        return None
+
+    def run_job(self, job: Dict) -> Dict:
+        """
+        Dubs one job and returns it with `status`, `timings` and, on failure, `error`.
+        """
+        started = time.time()
+        job["wait_s"] = round(started - job["submitted"], 3)
+        try:
+            output_dir = job["output_dir"] or os.path.join(self.spool_dir, "work", job["id"])
+            with self.pipeline.overrides(tts=job["tts"], postprocess=job["postprocess"]):
+                self.pipeline.transform(job["input"], output_dir, output_path=job["output"])
+            job["status"] = "done"
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = f"{type(e).__name__}: {e}"
+            job["traceback"] = traceback.format_exc()
+        job["run_s"] = round(time.time() - started, 3)
+        return job
+
+    def run_once(self) -> Optional[Dict]:
+        """
+        Runs the oldest queued job. Returns None if the queue is empty.
+        """
+        running_path = self._claim()
+        if running_path is None:
+            return None
+        job = _read_job(running_path)
+        job["status"] = "running"
+        _write_job(running_path, job)
+        print(f"Job {job['id']}: {job['input']}")
+        job = self.run_job(job)
+        _write_job(running_path, job)
+        os.replace(running_path, os.path.join(self._dir(job["status"]), os.path.basename(running_path)))
+        print(f"Job {job['id']}: {job['status']}, waited {job['wait_s']:.2f} s, ran {job['run_s']:.2f} s")
+        return job
+
+    def serve(self, stop_when_empty: bool = False) -> None:
+        """
+        Runs jobs as they arrive until interrupted, or until the queue is empty with `stop_when_empty`.
+        """
+        print(f"Worker ready, spool: {self.spool_dir}")
+        while True:
+            job = self.run_once()
+            if job is None:
+                if stop_when_empty:
+                    return
+                time.sleep(self.poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve")
+    serve.add_argument("--config", default="config/config.yaml")
+    serve.add_argument("--spool", required=True)
+    serve.add_argument("--poll", type=float, default=1.0)
+    serve.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    serve.add_argument("--no-warmup", action="store_true", help="load models on first use instead of at start")
+    submit = commands.add_parser("submit")
+    submit.add_argument("--spool", required=True)
+    submit.add_argument("--input", required=True)
+    submit.add_argument("--output", required=True)
+    submit.add_argument("--output-dir", default=None)
+    submit.add_argument("--tts", type=json.loads, default=None, help="JSON overrides of the tts config section")
+    submit.add_argument("--postprocess", type=json.loads, default=None, help="JSON overrides of the postprocess config section")
+    status = commands.add_parser("status")
+    status.add_argument("--spool", required=True)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        pipeline = VideoDubPipe(args.config)
+        if not args.no_warmup:
+            pipeline.warmup()
+        try:
+            DubbingWorker(pipeline, args.spool, poll_interval=args.poll).serve(stop_when_empty=args.once)
+        except KeyboardInterrupt: # an interrupted job stays in `running` and is run again on restart
+            print("Worker stopped")
+    elif args.command == "submit":
+        print(submit_job(args.spool, args.input, args.output, args.tts, args.postprocess, args.output_dir))
+    else:
+        for job in list_jobs(args.spool):
+            timing = f" waited {job['wait_s']:.2f} s, ran {job['run_s']:.2f} s" if "run_s" in job else ""
+            print(f"{job['id']} {job['status']:8s} {job['input']}{timing}{' ' + job['error'] if 'error' in job else ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+from benchmarks.synthetic import write_wav
+from src.audio import to_audiosegment, to_pcm
+
+
+@pytest.mark.parametrize("sample_width", [1, 2, 4])
+def test_to_pcm_clips_to_integer_bounds(sample_width, tmp_path):
+    audio = np.array([-1.5, -1.0, -0.5, 0.0, 0.5, 1.0, 2.0], dtype=np.float32)
+    bounds = np.iinfo({1: np.int8, 2: np.int16, 4: np.int32}[sample_width])
+    half = 1 << (8 * sample_width - 2)
+    expected = [bounds.min, bounds.min, -half, 0, half, bounds.max, bounds.max]
+
+    path = write_wav(str(tmp_path / "clip.wav"), audio, 8000, sample_width)
+    assert AudioSegment.from_file(path).get_array_of_samples().tolist() == expected
+    assert to_audiosegment(audio[:, None], 8000, sample_width).get_array_of_samples().tolist() == expected
+    if sample_width == 1:
+        assert to_pcm(audio, 1).tolist() == [0, 0, 64, 128, 192, 255, 255]
@@ -0,0 +1,11 @@
+import os
+
+from src.batch import work_dir
+
+
+def test_work_dir_is_unique_per_input_path(tmp_path):
+    first = work_dir(str(tmp_path), "/season1/ep1.wav")
+    second = work_dir(str(tmp_path), "/season2/ep1.wav")
+    assert first != second
+    assert os.path.basename(first).startswith("ep1-")
+    assert work_dir(str(tmp_path), "/season1/ep1.wav") == first
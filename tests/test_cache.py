@@ -0,0 +1,103 @@
+import os
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+from src.cache import AudioCache, TranslationCache
+from src.tts import XTTSv2
+
+SPEAKER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "speaker_sample.wav")
+
+
+def test_translation_cache_persists_per_namespace(tmp_path):
+    path = str(tmp_path / "mt.sqlite")
+    cache = TranslationCache(path, "model-a")
+    cache.put_many(["Hello  there.", "Bye."], ["Привет.", "Пока."])
+    cache.close()
+
+    cache = TranslationCache(path, "model-a")
+    assert cache.get_many(["Hello there.", " Bye. ", "New."]) == ["Привет.", "Пока.", None]
+    assert cache.stats() == {"hits": 2, "misses": 1}
+    assert TranslationCache(path, "model-b").get("Bye.") is None
+
+
+def test_translation_cache_evicts_least_recently_used(tmp_path):
+    cache = TranslationCache(str(tmp_path / "mt.sqlite"), "model", max_entries=2)
+    cache.put_many(["a", "b"], ["A", "B"])
+    time.sleep(0.01)
+    assert cache.get("a") == "A"
+    cache.put("c", "C")
+    assert cache.get_many(["a", "b", "c"]) == ["A", None, "C"]
+
+
+def test_audio_cache_evicts_oldest_files(tmp_path):
+    audio = np.zeros(1000, dtype=np.float32)
+    cache = AudioCache(str(tmp_path / "tts"), max_bytes=6000) # room for one entry
+    first, second = AudioCache.key(text="a"), AudioCache.key(text="b")
+    cache.put(first, audio)
+    os.utime(os.path.join(cache.directory, f"{first}.npy"), (0, 0))
+    cache.put(second, audio)
+    assert cache.get(first) is None
+    np.testing.assert_array_equal(cache.get(second), audio)
+    assert AudioCache(str(tmp_path / "tts")).stats()["bytes"] == cache.stats()["bytes"]
+
+
+class FakeXtts:
+    device = "cpu"
+
+    def __init__(self, gpt_cond_len=30):
+        self.config = SimpleNamespace(gpt_cond_len=gpt_cond_len, gpt_cond_chunk_len=4, max_ref_len=30, sound_norm_refs=False)
+        self.calls = []
+
+    def get_conditioning_latents(self, audio_path, **settings):
+        self.calls.append(settings)
+        return torch.full((1, 32, 1024), float(len(self.calls))), torch.ones(1, 512, 1)
+
+
+def _xtts(tmp_path, gpt_cond_len=30):
+    tts = XTTSv2(latents_dir=str(tmp_path / "latents"))
+    tts._xtts = FakeXtts(gpt_cond_len)
+    return tts
+
+
+def test_latents_are_computed_once_per_reference_and_settings(tmp_path):
+    tts = _xtts(tmp_path)
+    latent, _ = tts.get_cond_latents(SPEAKER)
+    tts.get_cond_latents(SPEAKER)
+    assert tts.xtts.calls == [{"gpt_cond_len": 30, "gpt_cond_chunk_len": 4, "max_ref_length": 30, "sound_norm_refs": False}]
+
+    restored = _xtts(tmp_path)
+    torch.testing.assert_close(restored.get_cond_latents(SPEAKER)[0], latent)
+    assert restored.xtts.calls == []
+
+    other = _xtts(tmp_path, gpt_cond_len=6)
+    other.get_cond_latents(SPEAKER)
+    assert len(other.xtts.calls) == 1
+
+
+class CountingXTTS(XTTSv2):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.texts = []
+
+    def tts(self, text, speaker_wav, **params):
+        self.texts.append(text)
+        return np.full(10 * len(text), params["speed"], dtype=np.float32)
+
+
+def test_synthesized_audio_is_cached_by_text_and_params(tmp_path):
+    chunks = {0: {"translated_text": "Привет."}, 1: {"translated_text": ""}, 2: {"translated_text": "Пока."}}
+    tts = CountingXTTS(audio_cache_dir=str(tmp_path / "tts"))
+    first = tts.tts_chunks(chunks, SPEAKER)
+    assert tts.texts == ["Привет.", "Пока."]
+
+    tts = CountingXTTS(audio_cache_dir=str(tmp_path / "tts"))
+    again = tts.tts_chunks(chunks, SPEAKER)
+    assert tts.texts == []
+    for a, b in zip(first, again):
+        np.testing.assert_array_equal(a, b)
+
+    tts.tts_chunks(chunks, SPEAKER, speed=1.2)
+    assert tts.texts == ["Привет.", "Пока."]
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+from src.audio import AudioStore, to_audiosegment
+from src.helpers import apply_fade_and_normalize, overlay_on_chunk
+from src.mixer import Mixer, StreamingMixer
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+def _samples(segment):
+    return np.array(segment.get_array_of_samples(), dtype=np.int64)
+
+
+@pytest.mark.parametrize("name", ["audio1.wav", "audio_ch_2.wav"])
+def test_add_speech_matches_overlay_on_chunk(name):
+    store = AudioStore(os.path.join(DATA, name))
+    sr = store.sample_rate
+    rng = np.random.default_rng(0)
+    t = np.arange(2 * sr) / sr
+    synth = (0.4 * np.sin(2 * np.pi * 220 * t) * np.linspace(0.2, 1.0, len(t))).astype(np.float32)
+    synth[-sr // 20:] += 0.5 # peak inside the fade out
+    synth += 0.01 * rng.standard_normal(len(t)).astype(np.float32)
+    chunk = {"orig_seg": {"start": 1000, "end": 4000}}
+
+    mixer = Mixer(store)
+    mixer.add_chunk(chunk)
+    mixer.add_speech(chunk, 500, 2500, synth.copy(), sr)
+    got = mixer.to_audiosegment()[1000:4000]
+
+    synth_segment = apply_fade_and_normalize(to_audiosegment(synth[:, None], sr))
+    expected = overlay_on_chunk(store.segment[1000:4000], 500, 2500, synth_segment)
+    assert len(got) == len(expected)
+    assert np.abs(_samples(got) - _samples(expected)).max() <= 8 # rounding of the int16 steps in pydub
+
+
+def test_streaming_mixer_matches_mixer(tmp_path):
+    store = AudioStore(os.path.join(DATA, "audio_ch_2.wav"))
+    sr = store.sample_rate
+    t = np.arange(sr) / sr
+    synth = (0.3 * np.sin(2 * np.pi * 180 * t)).astype(np.float32)
+    chunks = [{"orig_seg": {"start": s, "end": e}} for s, e in [(200, 1900), (2500, 4100), (4100, 5000)]]
+    speech = [(100, 1200), (0, 1600), None]
+
+    mixer = Mixer(store)
+    streaming = StreamingMixer(store, str(tmp_path / "mix.wav"), block_size=1000)
+    for m in (mixer, streaming):
+        for chunk, bounds in zip(chunks, speech):
+            m.add_chunk(chunk)
+            if bounds:
+                m.add_speech(chunk, *bounds, synth.copy(), sr)
+    expected = mixer.to_audiosegment()
+    got = AudioSegment.from_file(streaming.close())
+    assert len(got) == len(expected)
+    np.testing.assert_array_equal(_samples(got), _samples(expected))
+
+
+def test_streaming_mixer_rejects_chunks_out_of_order(tmp_path):
+    store = AudioStore(os.path.join(DATA, "audio1.wav"))
+    mixer = StreamingMixer(store, str(tmp_path / "mix.wav"))
+    mixer.add_chunk({"orig_seg": {"start": 1000, "end": 2000}})
+    with pytest.raises(ValueError):
+        mixer.add_chunk({"orig_seg": {"start": 500, "end": 900}})
+    mixer.close()
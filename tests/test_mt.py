@@ -0,0 +1,37 @@
+from src.cache import TranslationCache
+from src.mt import MT
+
+
+class CountingMT(MT):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.generated = []
+
+    def _generate(self, sentences):
+        self.generated.extend(sentences)
+        return [s.upper() for s in sentences]
+
+
+def _chunks(*texts):
+    return {i: {"len": 1.0, "asr_result": [[{"text": t}]]} for i, t in enumerate(texts)}
+
+
+def test_repeated_sentence_is_generated_once(tmp_path):
+    path = str(tmp_path / "mt.sqlite")
+    mt = CountingMT(cache_path=path)
+    mt._cache = TranslationCache(path, "test")
+    chunks = mt.translate(_chunks("Thank you. Hello there.", "Thank you.", "Thank you. Bye."))
+    assert mt.generated == ["Thank you.", "Hello there.", "Bye."]
+    assert [c["translated_text"] for c in chunks.values()] == [
+        "THANK YOU. HELLO THERE.", "THANK YOU.", "THANK YOU. BYE."
+    ]
+
+    mt.generated.clear()
+    assert mt.translate(_chunks("Thank you. New one.", "New one."))[1]["translated_text"] == "NEW ONE."
+    assert mt.generated == ["New one."]
+
+
+def test_repeated_sentence_without_cache():
+    mt = CountingMT()
+    assert mt._translate(["a.", "b.", "a."]) == ["A.", "B.", "A."]
+    assert mt.generated == ["a.", "b."]
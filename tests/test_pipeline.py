@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pytest
+import yaml
+from pydub import AudioSegment
+
+from benchmarks.bench_suite import pipeline_config
+from benchmarks.stubs import StubASR, StubMT, StubTTS, StubVAD
+from benchmarks.synthetic import speech_with_pauses, write_wav
+from src.pipeline import VideoDubPipe
+
+SAMPLE_RATE = 24000
+
+
+class CountingASR(StubASR):
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def transcribe(self, chunks_json, store=None, output_dir=None, save=True):
+        self.chunks.extend(chunks_json)
+        return super().transcribe(chunks_json, store, output_dir, save)
+
+
+class CountingTTS(StubTTS):
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def tts_chunks(self, chunks, speaker_wav, **params):
+        self.chunks.extend(chunks)
+        return super().tts_chunks(chunks, speaker_wav, **params)
+
+
+@pytest.fixture
+def run(tmp_path):
+    audio, _ = speech_with_pauses(40, SAMPLE_RATE, seed=3)
+    path = write_wav(str(tmp_path / "input.wav"), audio, SAMPLE_RATE)
+
+    def dub(streaming=False, in_memory=False, name="output.wav"):
+        config_path = pipeline_config(str(tmp_path), path, streaming)
+        with open(config_path) as f:
+            cfg = yaml.safe_load(f)
+        cfg["cache"] = {"dir": str(tmp_path / "cache"), "resume": True, "checkpoint_every": 2}
+        with open(config_path, "w") as f:
+            yaml.safe_dump(cfg, f)
+        asr, tts = CountingASR(), CountingTTS()
+        pipe = VideoDubPipe(config_path, asr_model=asr, mt_model=StubMT(), tts_model=tts, vad=StubVAD())
+        output_dir = str(tmp_path / "output")
+        if in_memory:
+            result = pipe.transform(path, output_dir)
+        else:
+            result = AudioSegment.from_file(pipe.transform(path, output_dir, str(tmp_path / name)))
+        return np.array(result.get_array_of_samples()), pipe, asr, tts
+
+    dub.input_path = path
+    return dub
+
+
+def test_streaming_in_memory_and_resumed_runs_match(run):
+    first, _, asr, tts = run()
+    assert asr.chunks and tts.chunks
+    resumed, _, asr, tts = run(name="resumed.wav")
+    assert asr.chunks == [] and tts.chunks == []
+    streamed, _, asr, tts = run(streaming=True, name="streamed.wav")
+    assert asr.chunks == [] and tts.chunks == []
+    in_memory, _, _, _ = run(in_memory=True)
+    np.testing.assert_array_equal(resumed, first)
+    np.testing.assert_array_equal(streamed, first)
+    np.testing.assert_array_equal(in_memory, first)
+
+
+def test_cold_streaming_run_matches_stages(run):
+    streamed, _, asr, _ = run(streaming=True, name="streamed.wav")
+    assert asr.chunks
+    stages, _, asr, tts = run(name="stages.wav")
+    # the streaming run stores every per-chunk result but not the chunk split
+    assert asr.chunks == [] and tts.chunks == []
+    np.testing.assert_array_equal(streamed, stages)
+
+
+def test_interrupted_stage_resumes_at_chunk_level(run):
+    first, pipe, _, tts = run()
+    chunk_ids = list(tts.chunks)
+    assert len(chunk_ids) > 2
+    keys = pipe._stage_keys(run.input_path)
+    artifacts = pipe._artifacts(None)
+    tts_dir = artifacts.stage_dir("tts", keys["tts"])
+    os.remove(os.path.join(tts_dir, "_done"))
+    os.remove(os.path.join(tts_dir, f"chunk_{chunk_ids[-1]}.npy"))
+
+    resumed, _, asr, tts = run(name="resumed.wav")
+    assert asr.chunks == []
+    assert tts.chunks == [chunk_ids[-1]]
+    np.testing.assert_array_equal(resumed, first)
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from src.segments import SegmentTable
+from src.utils import update_boundary
+
+
+def _place(length: float, speech: dict, duration: float) -> dict:
+    # the per-chunk placement `update_boundary` used before it was vectorized
+    orig_start = round(speech["start"] / 16000, 2)
+    orig_end = round(speech["end"] / 16000, 2)
+    if duration - (orig_end - orig_start) > 0:
+        return {"start": orig_start, "end": orig_end}
+    start = (orig_end + orig_start) / 2 - duration / 2
+    end = start + duration
+    if start < 0:
+        start = 0
+        end = start + duration
+    if end > length:
+        end = length
+        start = end - duration
+    return {"start": start, "end": end}
+
+
+def _random_chunks(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    chunks, durations, position = {}, [], 0
+    for i in range(n):
+        start = position + int(rng.integers(0, 2000))
+        end = start + int(rng.integers(100, 8000))
+        position = end
+        chunk = {"len": round((end - start) / 1000, 1), "orig_seg": {"start": start, "end": end}, "speech_boundary": []}
+        if rng.random() > 0.1:
+            speech_start = int(rng.integers(0, (end - start) * 16 // 2))
+            speech_end = int(rng.integers(speech_start + 1, (end - start) * 16 + 1))
+            chunk["speech_boundary"] = [{"start": speech_start, "end": speech_end}]
+        chunks[i] = chunk
+        durations.append(round(float(rng.uniform(0, 1.3)) * (end - start) / 1000, 2))
+    return chunks, durations
+
+
+def test_lengths_match_chunk_len():
+    chunks, _ = _random_chunks(5000)
+    lengths = SegmentTable.from_chunks(chunks).lengths()
+    assert lengths.tolist() == [chunk["len"] for chunk in chunks.values()]
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_fit_boundaries_matches_update_boundary(seed):
+    chunks, durations = _random_chunks(3000, seed)
+    expected = [
+        _place(chunk["len"], chunk["speech_boundary"][0], duration) if chunk["speech_boundary"] else {}
+        for chunk, duration in zip(chunks.values(), durations)
+    ]
+    assert update_boundary(chunks, durations) == expected
+    assert SegmentTable.from_chunks(chunks).fit_boundaries(durations) == expected
+
+
+def test_fit_boundaries_clamps_to_rounded_length():
+    # 2150 ms rounds to a 2.1 s chunk, speech that overruns it is shifted back inside
+    chunks = {0: {"len": 2.1, "orig_seg": {"start": 0, "end": 2150}, "speech_boundary": [{"start": 28800, "end": 34240}]}}
+    expected = update_boundary(chunks, [0.3])
+    assert expected == [{"start": pytest.approx(1.8), "end": 2.1}]
+    assert SegmentTable.from_chunks(chunks).fit_boundaries([0.3]) == expected
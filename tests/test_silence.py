@@ -0,0 +1,42 @@
+import glob
+import os
+
+import pytest
+from pydub import AudioSegment
+from pydub.silence import detect_nonsilent as pydub_detect_nonsilent
+
+from src.audio import AudioStore
+from src.silence import SilenceDetector, detect_nonsilent
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+PATHS = sorted(glob.glob(os.path.join(DATA, "*.wav")))
+PARAMS = [(700, -40, 1), (300, -30, 1), (500, -45, 10)]
+
+
+def _assert_parity(path: str) -> None:
+    segment = AudioSegment.from_file(path)
+    store = AudioStore(path)
+    for min_silence_len, silence_thresh, seek_step in PARAMS:
+        expected = pydub_detect_nonsilent(segment, min_silence_len, silence_thresh, seek_step)
+        got = detect_nonsilent(
+            store.samples, store.sample_rate, min_silence_len, silence_thresh, seek_step,
+            sample_width=store.sample_width, block_size=4096,
+        )
+        got_wav = SilenceDetector.from_wav(path, block_size=4096).detect_nonsilent(
+            min_silence_len, silence_thresh, seek_step
+        )
+        assert got == expected, (min_silence_len, silence_thresh, seek_step)
+        assert got_wav == expected, (min_silence_len, silence_thresh, seek_step)
+
+
+@pytest.mark.parametrize("path", PATHS, ids=os.path.basename)
+def test_matches_pydub(path):
+    _assert_parity(path)
+
+
+@pytest.mark.parametrize("sample_width", [1, 4])
+@pytest.mark.parametrize("path", PATHS[:3], ids=os.path.basename)
+def test_matches_pydub_other_sample_widths(path, sample_width, tmp_path):
+    converted = str(tmp_path / f"{sample_width * 8}bit.wav")
+    AudioSegment.from_file(path).set_sample_width(sample_width).export(converted, format="wav")
+    _assert_parity(converted)
@@ -0,0 +1,48 @@
+import threading
+import time
+
+import pytest
+
+from src.streaming import run_stages
+
+
+def test_outputs_keep_input_order_and_stages_overlap():
+    active, overlap, lock = set(), [], threading.Lock()
+
+    def stage(name):
+        def fn(item):
+            with lock:
+                active.add(name)
+                overlap.append(len(active))
+            time.sleep(0.002)
+            with lock:
+                active.discard(name)
+            return item + [name]
+        return fn
+
+    out = list(run_stages(([i] for i in range(20)), [stage("a"), stage("b"), stage("c")], queue_size=1))
+    assert out == [[i, "a", "b", "c"] for i in range(20)]
+    assert max(overlap) > 1
+
+
+def test_error_is_raised_after_stages_drain():
+    seen = []
+
+    def fail(item):
+        if item == 3:
+            raise RuntimeError("boom")
+        return item
+
+    with pytest.raises(RuntimeError, match="boom"):
+        for item in run_stages(range(100), [fail, seen.append], queue_size=2):
+            pass
+    assert 3 not in seen and len(seen) < 100
+
+
+def test_error_in_input_iterator():
+    def items():
+        yield 1
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError, match="bad input"):
+        list(run_stages(items(), [lambda x: x]))
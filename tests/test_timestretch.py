@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from src.timestretch import stretched_length, wsola
+
+SAMPLE_RATE = 24000
+
+
+@pytest.mark.parametrize("rate", [0.7, 0.9, 1.3, 1.8])
+def test_constant_input_has_no_fades(rate):
+    audio = np.full(SAMPLE_RATE, 0.5, dtype=np.float32)
+    out = wsola(audio, rate, SAMPLE_RATE)
+    assert len(out) == stretched_length(len(audio), rate)
+    np.testing.assert_allclose(out, 0.5, atol=1e-6)
+
+
+@pytest.mark.parametrize("rate", [0.8, 1.25])
+def test_tone_keeps_its_level(rate):
+    t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+    out = wsola((0.5 * np.sin(2 * np.pi * 200 * t)).astype(np.float32), rate, SAMPLE_RATE)
+    blocks = out[:len(out) // 120 * 120].reshape(-1, 120) # 200 Hz periods
+    np.testing.assert_allclose(np.abs(blocks).max(axis=1), 0.5, atol=0.02)
+
+
+def test_unit_rate_returns_input():
+    audio = np.random.default_rng(0).standard_normal(1000).astype(np.float32)
+    np.testing.assert_array_equal(wsola(audio, 1.0, SAMPLE_RATE), audio)
+    np.testing.assert_array_equal(wsola(audio, 1 + 1e-6, SAMPLE_RATE), audio)
@@ -0,0 +1,18 @@
+import numpy as np
+
+from src.tts import GPT_TOKENS_PER_S, plan_budget
+
+
+def test_plan_budget_token_cap_covers_slow_speech():
+    for length in (10, 60, 180):
+        text = "a" * length
+        plan = plan_budget(text, 1.0, 1.0, 1.6, 14.0, 8.0, 1.0)
+        assert plan["max_new_tokens"] >= length / 8.0 * GPT_TOKENS_PER_S
+
+
+def test_plan_budget_speed_fits_slot():
+    text = "a" * 42 # 3 s at 14 characters per second
+    assert plan_budget(text, 3.0, 1.0, 1.6, 14.0, 8.0, 1.3)["speed"] == 1.0
+    assert plan_budget(text, 2.0, 1.0, 1.6, 14.0, 8.0, 1.3)["speed"] == 1.5
+    assert plan_budget(text, 1.0, 1.0, 1.6, 14.0, 8.0, 1.3)["speed"] == 1.6
+    assert np.isclose(plan_budget(text, 0.0, 1.2, 1.6, 14.0, 8.0, 1.3)["speed"], 1.2)
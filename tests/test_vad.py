@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from src.vad import assign_speech, merge_timestamps
+
+
+def _assign(speech, bounds, threshold, min_length):
+    # per chunk: clip every interval to the chunk, drop short ones, merge close ones
+    result = []
+    for lo, hi in bounds:
+        pieces = []
+        for start, end in speech:
+            start, end = max(start, lo) - lo, min(end, hi) - lo
+            if end - start >= min_length and end > 0 and start < hi - lo:
+                pieces.append({"start": int(start), "end": int(end)})
+        merged = []
+        for piece in pieces:
+            if merged and piece["start"] - merged[-1]["end"] <= threshold:
+                merged[-1]["end"] = max(merged[-1]["end"], piece["end"])
+            else:
+                merged.append(dict(piece))
+        result.append(merged)
+    return result
+
+
+def _random_case(seed):
+    rng = np.random.default_rng(seed)
+    edges = np.cumsum(rng.integers(1, 30000, size=400))
+    speech = edges.reshape(-1, 2)
+    cuts = np.cumsum(rng.integers(1000, 80000, size=60))
+    cuts = cuts[cuts < edges[-1] + 10000]
+    starts = cuts[:-1] + rng.integers(0, 500, size=len(cuts) - 1)
+    bounds = np.stack([starts, np.maximum(starts + 1, cuts[1:] - rng.integers(0, 500, size=len(cuts) - 1))], axis=1)
+    return speech.astype(np.int64), bounds.astype(np.int64)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("threshold, min_length", [(16000, 0), (4000, 4000), (0, 1)])
+def test_assign_speech_matches_per_chunk_merge(seed, threshold, min_length):
+    speech, bounds = _random_case(seed)
+    assert assign_speech(speech, bounds, threshold, min_length) == _assign(speech, bounds, threshold, min_length)
+
+
+def test_assign_speech_without_speech():
+    bounds = np.array([[0, 100], [200, 300]], dtype=np.int64)
+    assert assign_speech(np.zeros((0, 2), dtype=np.int64), bounds, 16000) == [[], []]
+
+
+def test_merge_timestamps():
+    timestamps = [{"start": 0, "end": 10}, {"start": 15, "end": 20}, {"start": 40, "end": 50}]
+    assert merge_timestamps(timestamps, 5) == [{"start": 0, "end": 20}, {"start": 40, "end": 50}]
+    assert merge_timestamps(timestamps, 100) == [{"start": 0, "end": 50}]
+    assert merge_timestamps([], 5) == []